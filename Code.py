@@ -1,10 +1,19 @@
 import pygame
 from pygame.locals import *
 import sys
+import argparse
 import os
-from collections import deque
+import json
+import queue
+import threading
+import weakref
+from time import perf_counter
+import numpy as np
+from array import array
+from collections import Counter, OrderedDict, deque
 from typing import NamedTuple
-from itertools import chain
+
+STARTED = perf_counter()  # for the startup time report
 
 RELEASING = False  # set to True when releasing with PyInstaller
 
@@ -18,9 +27,6 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-pygame.init()
-pygame.mixer.init()
-
 Vec = pygame.math.Vector2  # 2 for two dimensional
 
 HEIGHT = 600  # Screen height
@@ -30,73 +36,415 @@ FRIC_X = -0.09  # Air resistance
 FRIC_Y = -0.01
 BULLET_FREEZE = 60  # frames
 BULLET_SPEED = 12  # pixels/frame
+TICK_RATE = 60  # simulation steps per second
+MAX_STEPS_PER_FRAME = 5  # catch-up limit before the game slows down
+
+SOUND_FILES = {
+    "jump": "images/Jump.mp3",
+    "hit": "images/HitSound.mp3",
+    "game_over": "images/GameOver.mp3",
+    "win": "images/LevelCompleteSound.mp3",
+}
+sounds = {}  # filled in by load_sounds
+
+muted = False  # set to True to silence sound effects, e.g. when running headless
+
+def load_sounds():
+    """Decode the sound effects, if the mixer is up."""
+    if not pygame.mixer.get_init():
+        return
+    for name, path in SOUND_FILES.items():
+        if name not in sounds:
+            sounds[name] = pygame.mixer.Sound(resource_path(path))
+
+def play_sound(name):
+    """Play a sound effect; skipped while it is still being decoded."""
+    sound = sounds.get(name)
+    if not muted and sound is not None:
+        sound.play()
+
+class InputState(NamedTuple):
+    """Input for a single simulation tick.
+
+    aim is the mouse position in screen coordinates, as returned by
+    pygame.mouse.get_pos().
+    """
+    left: bool = False
+    right: bool = False
+    jump: bool = False
+    shoot: bool = False
+    aim: tuple = (0, 0)
+
+    @classmethod
+    def from_pygame(cls):
+        pressed_keys = pygame.key.get_pressed()
+        return cls(
+            pressed_keys[K_LEFT] or pressed_keys[K_a],
+            pressed_keys[K_RIGHT] or pressed_keys[K_d],
+            pressed_keys[K_w] or pressed_keys[K_UP],
+            pressed_keys[K_SPACE],
+            pygame.mouse.get_pos(),
+        )
 
-jumpsound = pygame.mixer.Sound(resource_path("images/Jump.mp3"))
-hitsound = pygame.mixer.Sound(resource_path("images/HitSound.mp3"))
-GameOverSound = pygame.mixer.Sound(resource_path("images/GameOver.mp3"))
-GameWinSound = pygame.mixer.Sound(resource_path("images/LevelCompleteSound.mp3"))
+IDLE = InputState()
 
-class Images(pygame.sprite.Sprite):
-    _img_cache = {}
+def display_format(surface: pygame.Surface) -> pygame.Surface:
+    """Convert surface to the display's pixel format once a window exists."""
+    if pygame.display.get_surface() is None:
+        return surface
+    if (
+        surface.get_flags() & SRCALPHA
+        and pygame.surfarray.array_alpha(surface).min() < 255
+    ):
+        return surface.convert_alpha()
+    return surface.convert()
+
+class TextureHandle:
+    """A scaled image that sprites share and draw through.
+
+    Sprites hold a handle instead of a surface, so TextureAtlas.build can
+    later swap every handle's surface for a region of the atlas.
+    """
+    _cache = {}
+    _decoded = {}  # images scaled ahead of time by preload()
+
+    def __init__(self, picture, size):
+        self.picture = picture
+        self.size = size
+        image = self._decoded.pop((picture, size), None)
+        if image is None:
+            image = pygame.transform.scale(pygame.image.load(picture), size)
+        self.surface = display_format(image)
+
+    @classmethod
+    def get(cls, picture, size):
+        cache_key = (resource_path(picture), tuple(size))
+        if cache_key not in cls._cache:
+            cls._cache[cache_key] = cls(*cache_key)
+        return cls._cache[cache_key]
+
+    @classmethod
+    def preload(cls, picture, size):
+        """Decode and scale an image so a later get() only converts it.
+
+        Safe to call from a background thread.
+        """
+        cache_key = (resource_path(picture), tuple(size))
+        if cache_key not in cls._cache and cache_key not in cls._decoded:
+            cls._decoded[cache_key] = pygame.transform.scale(
+                pygame.image.load(cache_key[0]), cache_key[1]
+            )
+
+class TextureAtlas:
+    """Packs every sprite texture into one display-format surface."""
+    ATLAS_WIDTH = 512
+    MAX_SPRITE_SIZE = 256  # bigger images (backgrounds) are kept apart
+    PRELOAD = (
+        ("images/Player.png", (30, 75)),
+        ("images/PlayerLeft.png", (30, 75)),
+        ("images/Enemy.png", (30, 75)),
+        ("images/EnemyLeft.png", (30, 75)),
+        ("images/Bullet.png", (20, 20)),
+        ("images/Key.png", (30, 30)),
+        ("images/LockedDoor.png", (150, 150)),
+        ("images/GoalFlag.png", (50, 75)),
+        ("images/GameScreen.png", (WIDTH, HEIGHT)),
+        ("images/MenuScreen.png", (WIDTH, HEIGHT)),
+    )
+    surface = None
+
+    @classmethod
+    def build(cls):
+        """Load the known textures and pack them. Needs a display."""
+        for picture, size in cls.PRELOAD:
+            TextureHandle.get(picture, size)
+        handles = []
+        for handle in TextureHandle._cache.values():
+            if max(handle.size) <= cls.MAX_SPRITE_SIZE:
+                handles.append(handle)
+            else:
+                handle.surface = display_format(handle.surface)
+        # Shelf packing, tallest first
+        handles.sort(key=lambda handle: handle.size[1], reverse=True)
+        rects = []
+        x = y = shelf_height = 0
+        for handle in handles:
+            width, height = handle.size
+            if x + width > cls.ATLAS_WIDTH:
+                x = 0
+                y += shelf_height
+                shelf_height = 0
+            rects.append(pygame.Rect(x, y, width, height))
+            x += width
+            shelf_height = max(shelf_height, height)
+        atlas = pygame.Surface((cls.ATLAS_WIDTH, y + shelf_height), SRCALPHA)
+        for handle, rect in zip(handles, rects):
+            atlas.blit(handle.surface, rect)
+        cls.surface = display_format(atlas)
+        for handle, rect in zip(handles, rects):
+            handle.surface = cls.surface.subsurface(rect)
+
+def preload_assets():
+    """Decode the sounds and known textures, for a background thread."""
+    for picture, size in TextureAtlas.PRELOAD:
+        TextureHandle.preload(picture, size)
+    load_sounds()
 
+class Images(pygame.sprite.Sprite):
     def __init__(self, picture, Xpos, Ypos, width, height):
         pygame.sprite.Sprite.__init__(self)
         self.image_size = (width, height)
-        self._my_cache = self._img_cache.setdefault(type(self), {})
         self.reset_texture(picture)
         self.initial_pos = (Xpos, Ypos)
         self.rect = self.image.get_rect(topleft=self.initial_pos)
 
+    @property
+    def image(self):
+        return self.texture.surface
+
     def reset_texture(self, picture):
-        picture = resource_path(picture)
-        cache_key = (picture, self.image_size)
-        if cache_key in self._my_cache:
-            self.image = self._my_cache[cache_key]
-        else:
-            self._my_cache[cache_key] = self.image = pygame.transform.scale(
-                pygame.image.load(picture), self.image_size
-            )
+        self.texture = TextureHandle.get(picture, self.image_size)
+
+    def facing_textures(self, right_picture, left_picture):
+        """Handles to pick from by turning_left, to avoid per-frame lookups."""
+        return (
+            TextureHandle.get(right_picture, self.image_size),
+            TextureHandle.get(left_picture, self.image_size),
+        )
 
     def reset(self):
         self.rect.topleft = self.initial_pos
 
     def blit(self, background_surface: pygame.Surface, camera_x_offset):
         new_rect = self.rect.move(-camera_x_offset, 0)
-        background_surface.blit(self.image, new_rect)
+        return background_surface.blit(self.image, new_rect)
 
 class ImageHorizontalTile(pygame.sprite.Sprite):
+    """A texture repeated horizontally to fill a rect.
+
+    The tiles are pre-composed into one strip per (texture, height) which
+    every platform using that texture shares, so a visible platform costs
+    a single blit. Strips are capped at STRIP_MAX_WIDTH and repeated for
+    platforms wider than that.
+    """
+    STRIP_MAX_WIDTH = 2048
+    _strip_cache = {}
+    _tile_cache = {}
+
     def __init__(self, picture, x, y, width, height):
         super().__init__()
-        img = pygame.image.load(resource_path(picture))
-        self.image = pygame.transform.scale_by(img, height / img.get_height())
         self.rect = pygame.Rect(x, y, width, height)
-        self.img_width = self.image.get_width()
         self.height = height
+        self.strip_key = (resource_path(picture), height)
+        self._bake(width)
+
+    def _bake(self, width):
+        picture, height = self.strip_key
+        tile = self._tile_cache.get(self.strip_key)
+        if tile is None:
+            img = pygame.image.load(picture)
+            self._tile_cache[self.strip_key] = tile = pygame.transform.scale_by(
+                img, height / img.get_height()
+            )
+        tile_width = tile.get_width()
+        max_width = max(
+            tile_width, self.STRIP_MAX_WIDTH // tile_width * tile_width
+        )
+        strip = self._strip_cache.get(self.strip_key)
+        if strip is not None and strip.get_width() >= min(width, max_width):
+            return
+        strip_width = min(
+            max_width, -(-width // tile_width) * tile_width
+        )
+        strip = pygame.Surface((strip_width, height), SRCALPHA)
+        for x in range(0, strip_width, tile_width):
+            strip.blit(tile, (x, 0))
+        self._strip_cache[self.strip_key] = display_format(strip)
+
+    @classmethod
+    def convert_strips(cls):
+        """Convert strips baked before the display was created."""
+        for key, strip in cls._strip_cache.items():
+            cls._strip_cache[key] = display_format(strip)
 
     def blit(self, background_surface: pygame.Surface, camera_x_offset):
         new_rect = self.rect.move(-camera_x_offset, 0)
-        r = range(new_rect.x, new_rect.right, self.img_width)
-        for x in r[:-1]:
-            background_surface.blit(self.image, (x, new_rect.y))
-        background_surface.blit(
-            self.image, (r[-1], new_rect.y),
-            (0, 0, new_rect.right - r[-1], self.height)
+        strip = self._strip_cache[self.strip_key]
+        strip_width = strip.get_width()
+        if new_rect.width <= strip_width:
+            return background_surface.blit(
+                strip, new_rect, (0, 0, new_rect.width, self.height)
+            )
+        # Wider than the strip: repeat it, skipping offscreen repetitions
+        surface_width = background_surface.get_width()
+        start = new_rect.x
+        if start < 0:
+            start += (-start) // strip_width * strip_width
+        for x in range(start, min(new_rect.right, surface_width), strip_width):
+            background_surface.blit(
+                strip, (x, new_rect.y),
+                (0, 0, min(strip_width, new_rect.right - x), self.height)
+            )
+        return new_rect.clip(background_surface.get_rect())
+
+class SpatialGrid:
+    """Uniform grid over x of sprites with a rect, used as a broadphase.
+
+    Behaves like the list it replaces (append, extend, remove, iteration)
+    but query() only looks at the columns a rect covers. Results keep
+    insertion order, so code that relies on the order of the old list
+    behaves the same.
+    """
+    CELL_WIDTH = 128
+
+    def __init__(self, map_width, items=()):
+        self.columns = [[] for _ in range(map_width // self.CELL_WIDTH + 1)]
+        self.order = {}
+        self.counter = 0
+        self.extend(items)
+
+    def _column_range(self, rect):
+        last = len(self.columns) - 1
+        first_col = min(max(rect.left // self.CELL_WIDTH, 0), last)
+        last_col = min(max((rect.right - 1) // self.CELL_WIDTH, 0), last)
+        return range(first_col, last_col + 1)
+
+    def append(self, item):
+        self.order[item] = self.counter
+        self.counter += 1
+        for col in self._column_range(item.rect):
+            self.columns[col].append(item)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def remove(self, item):
+        del self.order[item]
+        for col in self._column_range(item.rect):
+            self.columns[col].remove(item)
+
+    def __contains__(self, item):
+        return item in self.order
+
+    def __iter__(self):
+        return iter(sorted(self.order, key=self.order.__getitem__))
+
+    def __len__(self):
+        return len(self.order)
+
+    def query(self, rect):
+        cols = self._column_range(rect)
+        if len(cols) == 1:
+            return self.columns[cols[0]]
+        found = set()
+        for col in cols:
+            found.update(self.columns[col])
+        return sorted(found, key=self.order.__getitem__)
+
+def sweep_aabb(boxes, deltas, targets):
+    """Swept AABB test of moving boxes against static ones.
+
+    boxes is (n, 4) as left, top, width, height, each moving by its row
+    of deltas (n, 2); targets is (m, 4). Returns (toi, normal) of shapes
+    (n, m) and (n, m, 2): toi is the fraction of the move at first
+    contact, inf where the box misses the target or already overlaps it,
+    and normal is the side of the target hit, e.g. (0, -1) for its top.
+    """
+    boxes = np.asarray(boxes, np.float64)[:, None, :]
+    deltas = np.asarray(deltas, np.float64)[:, None, :]
+    targets = np.asarray(targets, np.float64)[None, :, :]
+    low, size = boxes[..., :2], boxes[..., 2:]
+    target_low, target_size = targets[..., :2], targets[..., 2:]
+    # Per axis, the times the leading edge enters and the trailing edge
+    # leaves the target's extent
+    with np.errstate(divide="ignore", invalid="ignore"):
+        to_near = np.where(
+            deltas > 0, target_low - (low + size), target_low + target_size - low
+        ) / deltas
+        to_far = np.where(
+            deltas > 0, target_low + target_size - low, target_low - (low + size)
+        ) / deltas
+    still = deltas == 0
+    apart = (low + size <= target_low) | (low >= target_low + target_size)
+    entry = np.where(still, np.where(apart, np.inf, -np.inf), to_near)
+    leave = np.where(still, np.where(apart, -np.inf, np.inf), to_far)
+    enter_time = entry.max(axis=-1)
+    leave_time = leave.min(axis=-1)
+    hit = (enter_time < leave_time) & (enter_time >= 0) & (enter_time <= 1)
+    toi = np.where(hit, enter_time, np.inf)
+    axis = entry.argmax(axis=-1)
+    normal = np.zeros(toi.shape + (2,))
+    for i in (0, 1):
+        normal[..., i] = np.where(
+            hit & (axis == i), -np.sign(deltas[..., i]), 0
         )
+    return toi, normal
+
+def overshoots(boxes, deltas, targets, normal):
+    """Whether each move of sweep_aabb ends with its leading edge past the
+    far side of the target it hit.
+
+    Overlap tests can resolve a box that ends inside a target, but not
+    one that went this far through it in a single step.
+    """
+    end = np.asarray(boxes, np.float64)[:, None, :].copy()
+    end[..., :2] += np.asarray(deltas, np.float64)[:, None, :]
+    left, top = end[..., 0], end[..., 1]
+    right, bottom = left + end[..., 2], top + end[..., 3]
+    targets = np.asarray(targets, np.float64)[None, :, :]
+    target_left, target_top = targets[..., 0], targets[..., 1]
+    target_right = target_left + targets[..., 2]
+    target_bottom = target_top + targets[..., 3]
+    return (
+        ((normal[..., 0] < 0) & (right >= target_right))
+        | ((normal[..., 0] > 0) & (left <= target_left))
+        | ((normal[..., 1] < 0) & (bottom >= target_bottom))
+        | ((normal[..., 1] > 0) & (top <= target_top))
+    )
 
 class TextElements():
+    _font_cache = {}
+    _text_cache = OrderedDict()
+    TEXT_CACHE_SIZE = 64
+
     def __init__(self, font, size, colour, text, xpos, ypos):
-        self.words = text
+        self.words = None
         self.colour = colour
         self.xpos = xpos
         self.ypos = ypos
 
-        self.font = pygame.font.Font(resource_path(font), size)
-        self.text = self.font.render(self.words, True, colour)
-        self.rect = self.text.get_rect(center=(xpos, ypos))
+        self.font_key = (resource_path(font), size)
+        self.font = self.load_font(*self.font_key)
+        self.set_text(text)
+
+    @classmethod
+    def load_font(cls, font, size):
+        cache_key = (font, size)
+        if cache_key not in cls._font_cache:
+            cls._font_cache[cache_key] = pygame.font.Font(font, size)
+        return cls._font_cache[cache_key]
+
+    def render(self, words):
+        cache_key = (self.font_key, words, tuple(self.colour))
+        cache = self._text_cache
+        if cache_key in cache:
+            cache.move_to_end(cache_key)
+            return cache[cache_key]
+        text = cache[cache_key] = self.font.render(words, True, self.colour)
+        if len(cache) > self.TEXT_CACHE_SIZE:
+            cache.popitem(last=False)
+        return text
+
+    def set_text(self, words):
+        if words == self.words:
+            return
+        self.words = words
+        self.text = self.render(words)
+        self.rect = self.text.get_rect(center=(self.xpos, self.ypos))
 
     def update(self, screen):
-        self.text = self.font.render(self.words, True, self.colour)
-        self.rect = self.text.get_rect(center=(self.xpos, self.ypos))
+        self.set_text(self.words)
         screen.blit(self.text, self.rect)
 
 class Player(Images):
@@ -105,7 +453,10 @@ class Player(Images):
         self.height = 75
         self.map_width = map_width
         super().__init__("images/Player.png", x, y, self.width, self.height)
-        self.obstacles = []
+        self.textures = self.facing_textures(
+            "images/Player.png", "images/PlayerLeft.png"
+        )
+        self.obstacles = SpatialGrid(map_width)
         self.turning_left = False
         self.initial_shoot_cd = 120
 
@@ -119,21 +470,31 @@ class Player(Images):
     def reset(self):
         super().reset()
         self.pos = Vec(self.initial_pos)
+        self.previous_pos = self.pos.copy()
         self.vel = Vec(0, 0)
         self.acc = Vec(0, 0)
         self.shoot_cd = 30
 
-    def blit(self, background_surface, camera_x_offset):
-        self.rect.midbottom = self.pos
-        return super().blit(background_surface, camera_x_offset)
+    def interpolated_pos(self, alpha):
+        """Position between the last two physics steps, for drawing."""
+        if alpha >= 1:
+            return self.pos
+        return self.previous_pos.lerp(self.pos, alpha)
+
+    def blit(self, background_surface, camera_x_offset, alpha=1.0):
+        new_rect = self.image.get_rect(midbottom=self.interpolated_pos(alpha))
+        return background_surface.blit(
+            self.image, new_rect.move(-camera_x_offset, 0)
+        )
 
-    def physics(self):
+    def physics(self, inputs: InputState):
+        self.previous_pos = self.pos.copy()
         EPSILON_Y = self.vel.y
         on_platform_rect = None
         min_x = max_x = min_y = None
         platform_resistance_factor = 1.0
         hitbox = self.rect
-        for obstacle in self.obstacles:
+        for obstacle in self.obstacles.query(hitbox):
             plat_rect: pygame.Rect = obstacle.rect
             if hitbox.colliderect(plat_rect):
                 # Collision from top
@@ -156,23 +517,19 @@ class Player(Images):
                     min_x = plat_rect.right + self.width / 2
 
         self.acc = Vec(0, 0)
-        pressed_keys = pygame.key.get_pressed()
-        if pressed_keys[K_LEFT] or pressed_keys[K_a]:
+        if inputs.left:
             self.acc.x = -ACC
             self.turning_left = True
-            self.reset_texture('images/PlayerLeft.png')
-        if pressed_keys[K_RIGHT] or pressed_keys[K_d]:
+            self.texture = self.textures[True]
+        if inputs.right:
             self.acc.x = ACC
             self.turning_left = False
-            self.reset_texture('images/Player.png')
-        if (
-            (pressed_keys[K_w] or pressed_keys[K_UP])
-            and on_platform_rect is not None
-        ):
+            self.texture = self.textures[False]
+        if inputs.jump and on_platform_rect is not None:
             self.acc.y = -7  # Up
-            pygame.mixer.Sound.play(jumpsound)
+            play_sound("jump")
         self.shooting = False
-        if pressed_keys[K_SPACE] and self.shoot_cd <= 0:
+        if inputs.shoot and self.shoot_cd <= 0:
             self.shooting = True
             self.shoot_cd = self.initial_shoot_cd
         self.shoot_cd -= 1
@@ -214,54 +571,277 @@ class Player(Images):
             self.pos[0] = min(max_x, self.pos[0])
         if min_y is not None:
             self.pos[1] = max(min_y, self.pos[1])
+        self.stop_tunnelling()
+        self.rect.midbottom = self.pos
+
+    def stop_tunnelling(self):
+        """Catch a step that went right through an obstacle.
+
+        The overlap tests in physics only see where each step ends, so a
+        fast enough step would skip a thin platform or sink through it.
+        Such a step is cut to 1px inside the first obstacle it went
+        through, which the overlap tests resolve on the next step.
+        Contacts the step does not carry past, such as the floor the
+        player stands on, are left to those tests.
+        """
+        delta = self.pos - self.previous_pos
+        start = pygame.Rect(0, 0, self.width, self.height)
+        start.midbottom = self.previous_pos
+        swept = start.union(start.move(delta)).inflate(2, 2)
+        # Only a step at least as long as an obstacle is thick can do it
+        obstacles = self.obstacles.query(swept)
+        if not any(
+            obstacle.rect.width <= abs(delta.x)
+            or obstacle.rect.height <= abs(delta.y)
+            for obstacle in obstacles
+            if swept.colliderect(obstacle.rect)
+        ):
+            return
+        box = (
+            self.previous_pos.x - self.width / 2,
+            self.previous_pos.y - self.height, self.width, self.height,
+        )
+        rects = [tuple(obstacle.rect) for obstacle in obstacles]
+        toi, normal = sweep_aabb([box], [tuple(delta)], rects)
+        toi = np.where(
+            overshoots([box], [tuple(delta)], rects, normal), toi, np.inf
+        )
+        first = int(toi[0].argmin())
+        if toi[0, first] == np.inf:
+            return
+        self.pos.update(
+            self.previous_pos + delta * toi[0, first] - Vec(*normal[0, first])
+        )
 
     def is_in_void(self) -> bool:
         return self.pos.y > HEIGHT
 
 class Bullet(Images):
-    def __init__(self, x, y, to_x, to_y):
-        super().__init__("images/Bullet.png", x, y, 20, 20)
-        self.vel = Vec(to_x - x, to_y - y).normalize() * BULLET_SPEED
+    """The bullet texture; bullets themselves live in a BulletPool."""
+    SIZE = 20
+
+    def __init__(self):
+        super().__init__("images/Bullet.png", 0, 0, self.SIZE, self.SIZE)
+
+class BulletPool:
+    """All live bullets of a level as NumPy arrays, packed in firing order.
+
+    Rows [0, count) hold each bullet's top-left corner, where it was
+    before its last step and its per-tick step, so moving, culling and
+    hit-testing are one vectorised operation per tick instead of one
+    Python call per bullet.
+    """
+    def __init__(self, capacity=64):
+        self.pos = np.zeros((capacity, 2), np.int64)
+        self.start = np.zeros((capacity, 2), np.int64)
+        self.vel = np.zeros((capacity, 2), np.int64)
+        self.count = 0
+        self.bullet = Bullet()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def fire(self, x, y, to_x, to_y):
+        if self.count == len(self.pos):
+            self.pos = np.concatenate((self.pos, np.zeros_like(self.pos)))
+            self.start = np.concatenate((self.start, np.zeros_like(self.start)))
+            self.vel = np.concatenate((self.vel, np.zeros_like(self.vel)))
+        vel = Vec(to_x - x, to_y - y).normalize() * BULLET_SPEED
+        self.pos[self.count] = self.start[self.count] = x, y
+        # Bullets used to move with Rect.move_ip, which truncates
+        self.vel[self.count] = int(vel.x), int(vel.y)
+        self.count += 1
+
+    def _overlapping(self, rect):
+        pos = self.pos[:self.count]
+        return (
+            (pos[:, 0] < rect.right) & (pos[:, 0] + Bullet.SIZE > rect.left)
+            & (pos[:, 1] < rect.bottom) & (pos[:, 1] + Bullet.SIZE > rect.top)
+        )
 
-class MovementRecord(NamedTuple):
-    pos: Vec
-    left: bool
+    def _tunnelled(self, rects):
+        """Which bullets passed right through each rect in their last step."""
+        start = self.start[:self.count]
+        boxes = np.hstack((start, np.full_like(start, Bullet.SIZE)))
+        deltas = self.pos[:self.count] - start
+        toi, normal = sweep_aabb(boxes, deltas, rects)
+        return (toi != np.inf) & overshoots(boxes, deltas, rects, normal)
+
+    def _keep(self, alive):
+        kept = np.flatnonzero(alive)
+        if len(kept) == self.count:
+            return
+        self.pos[:len(kept)] = self.pos[kept]
+        self.start[:len(kept)] = self.start[kept]
+        self.vel[:len(kept)] = self.vel[kept]
+        self.count = len(kept)
+
+    def hit(self, rect) -> bool:
+        """Remove the oldest bullet overlapping rect, if there is one."""
+        if not self.count:
+            return False
+        hits = self._overlapping(rect)
+        # Only a step at least as long as rect is thick can skip it
+        if BULLET_SPEED >= min(rect.width, rect.height):
+            hits |= self._tunnelled([tuple(rect)])[:, 0]
+        hits = np.flatnonzero(hits)
+        if not len(hits):
+            return False
+        i = hits[0]
+        self.pos[i:self.count - 1] = self.pos[i + 1:self.count]
+        self.start[i:self.count - 1] = self.start[i + 1:self.count]
+        self.vel[i:self.count - 1] = self.vel[i + 1:self.count]
+        self.count -= 1
+        return True
+
+    def advance(self, game_field):
+        """Move every bullet one tick and drop those outside game_field."""
+        if not self.count:
+            return
+        self.start[:self.count] = self.pos[:self.count]
+        self.pos[:self.count] += self.vel[:self.count]
+        self._keep(self._overlapping(game_field))
+
+    def collide_obstacles(self, obstacles):
+        """Drop bullets overlapping or passed through any obstacle."""
+        if not self.count:
+            return
+        pos = self.pos[:self.count]
+        xs = np.concatenate((pos[:, 0], self.start[:self.count, 0]))
+        span = pygame.Rect(
+            int(xs.min()), 0, int(xs.max() - xs.min()) + Bullet.SIZE, HEIGHT
+        )
+        rects = np.array(
+            [tuple(obstacle.rect) for obstacle in obstacles.query(span)],
+            np.int64,
+        ).reshape(-1, 4)
+        if not len(rects):
+            return
+        left, top = rects[:, 0], rects[:, 1]
+        right, bottom = left + rects[:, 2], top + rects[:, 3]
+        hits = (
+            (pos[:, 0, None] < right) & (pos[:, 0, None] + Bullet.SIZE > left)
+            & (pos[:, 1, None] < bottom) & (pos[:, 1, None] + Bullet.SIZE > top)
+        ).any(axis=1)
+        if BULLET_SPEED >= rects[:, 2:].min():
+            hits |= self._tunnelled(rects).any(axis=1)
+        self._keep(~hits)
+
+    def blit(self, background_surface, camera_x_offset, view, alpha=1.0):
+        """Draw the bullets inside view and return the drawn rects.
+
+        With alpha < 1 bullets are drawn that far along their last step,
+        from where they were before it; one fired this tick has not
+        moved yet.
+        """
+        if not self.count:
+            return []
+        inside = self._overlapping(view)
+        visible = self.pos[:self.count][inside]
+        if alpha < 1:
+            start = self.start[:self.count][inside]
+            visible = (start + (visible - start) * alpha).astype(np.int64)
+        if not len(visible):
+            return []
+        visible[:, 0] -= int(camera_x_offset)
+        image = self.bullet.image
+        return background_surface.blits(
+            [(image, tuple(pos)) for pos in visible.tolist()]
+        )
+
+class PlayerHistory:
+    """Ring buffer of the player's position and facing, one entry per tick.
+
+    The level records once per tick and every Shadow replays it from its
+    own read cursor, so any number of shadows share the same storage. The
+    buffer only grows when the slowest shadow falls further behind than
+    its capacity.
+    """
+    def __init__(self, capacity=256):
+        self.readers = []
+        self._allocate(capacity)
+        self.clear()
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.xs = array('d', bytes(8 * capacity))
+        self.ys = array('d', bytes(8 * capacity))
+        self.left = array('b', bytes(capacity))
+
+    def clear(self):
+        self.written = 0
+
+    def _grow(self):
+        xs, ys, left = self.xs, self.ys, self.left
+        old_mask = self.capacity - 1
+        self._allocate(self.capacity * 2)
+        mask = self.capacity - 1
+        start = min(reader.cursor for reader in self.readers)
+        for tick in range(start, self.written):
+            self.xs[tick & mask] = xs[tick & old_mask]
+            self.ys[tick & mask] = ys[tick & old_mask]
+            self.left[tick & mask] = left[tick & old_mask]
+
+    def record(self, player):
+        if self.readers and self.written - min(
+            reader.cursor for reader in self.readers
+        ) >= self.capacity:
+            self._grow()
+        i = self.written & (self.capacity - 1)
+        self.xs[i], self.ys[i] = player.pos
+        self.left[i] = player.turning_left
+        self.written += 1
+
+    def read(self, tick):
+        i = tick & (self.capacity - 1)
+        return (self.xs[i], self.ys[i]), self.left[i]
 
 class Shadow(Images):
-    def __init__(self, x, y, countdown: int, player: Player):
+    def __init__(
+        self, x, y, countdown: int, player: Player,
+        history: PlayerHistory, all_bullets,
+    ):
         self.player = player
         super().__init__("images/Enemy.png", x, y, player.width, player.height)
+        self.textures = self.facing_textures(
+            "images/Enemy.png", "images/EnemyLeft.png"
+        )
+        self.history = history
+        history.readers.append(self)
         self.initial_countdown = countdown
         self.reset()
         self.turning_left = False
-        self.all_bullets = []
+        self.all_bullets = all_bullets
 
     def reset(self):
         super().reset()
-        self.past_movements = deque()
+        self.previous_topleft = self.rect.topleft
+        self.cursor = 0
         self.countdown = self.initial_countdown
 
     def track(self):
+        self.previous_topleft = self.rect.topleft
         if self.countdown > 0:
             self.countdown -= 1
-        self.past_movements.append(MovementRecord(
-            self.player.pos.copy(),
-            self.player.turning_left
-        ))
-        collide_bullet = self.rect.collidelist(self.all_bullets)
-        if collide_bullet != -1:
-            self.all_bullets.pop(collide_bullet)
+        if self.all_bullets.hit(self.rect):
             self.countdown = BULLET_FREEZE
-
-    def blit(self, background_surface, camera_x_offset):
         if self.countdown <= 0:
-            record: MovementRecord = self.past_movements.popleft()
-            self.rect.midbottom = record.pos
-            if record.left:
-                self.reset_texture("images/EnemyLeft.png")
-            else:
-                self.reset_texture("images/Enemy.png")
-        return super().blit(background_surface, camera_x_offset)
+            pos, left = self.history.read(self.cursor)
+            self.cursor += 1
+            self.rect.midbottom = pos
+            self.texture = self.textures[left]
+
+    def blit(self, background_surface, camera_x_offset, alpha=1.0):
+        if alpha >= 1:
+            return super().blit(background_surface, camera_x_offset)
+        (x0, y0), (x1, y1) = self.previous_topleft, self.rect.topleft
+        new_rect = self.rect.move(
+            (x0 - x1) * (1 - alpha) - camera_x_offset, (y0 - y1) * (1 - alpha)
+        )
+        return background_surface.blit(self.image, new_rect)
 
 class Platform(ImageHorizontalTile):
     resistance_factor = 1.0
@@ -295,7 +875,7 @@ class Key(Images):
 
     def blit(self, background_surface, camera_x_offset):
         if not self.used:
-            super().blit(background_surface, camera_x_offset)
+            return super().blit(background_surface, camera_x_offset)
 
 class Door(Images):
     resistance_factor = 1.0
@@ -312,13 +892,262 @@ class Door(Images):
 
     def blit(self, background_surface, camera_x_offset):
         if not self.unlocked:
-            super().blit(background_surface, camera_x_offset)
+            return super().blit(background_surface, camera_x_offset)
 
 class Goal(Images):
     def __init__(self, x, y):
         super().__init__("images/GoalFlag.png", x, y, 50, 75)
 
+class FrameProfiler:
+    """Times the stages of each frame for the overlay and exporter.
+
+    Code calls mark(stage) after each stage of a frame, and the time since
+    the previous mark is charged to that stage. While disabled, mark and
+    the other hooks are no-ops, so the probes can stay in release builds.
+    """
+    STAGES = (
+        "input", "physics", "shadow", "bullets", "level", "blit", "hud",
+        "display", "wait",
+    )
+    HISTORY = 120  # frames kept for the overlay's averages and worst case
+    OVERLAY_REFRESH = 30  # frames between overlay redraws
+
+    def __init__(self, enabled=False, export_path=None):
+        self.frames = deque(maxlen=self.HISTORY)
+        self.frame_number = 0
+        self.show_overlay = False
+        self.overlay_surface = None
+        self.export_file = None
+        if export_path is not None:
+            self.export_file = open(export_path, "w")
+            self.export_json = export_path.endswith((".json", ".jsonl"))
+            if not self.export_json:
+                self.export_file.write(
+                    ",".join(("frame",) + self.STAGES + ("total",)) + "\n"
+                )
+            enabled = True
+        self.set_enabled(enabled)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self._start_frame()
+            self.mark = self._mark
+            self.start_frame = self._start_frame
+            self.end_frame = self._end_frame
+        else:
+            self.mark = self.start_frame = self.end_frame = self._skip
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        self.overlay_surface = None
+        if self.show_overlay:
+            self.set_enabled(True)
+        elif self.export_file is None:
+            self.set_enabled(False)
+
+    def _skip(self, stage=None):
+        pass
+
+    def _start_frame(self):
+        self.current = dict.fromkeys(self.STAGES, 0.0)
+        self.last = perf_counter()
+
+    def _mark(self, stage):
+        now = perf_counter()
+        self.current[stage] += now - self.last
+        self.last = now
+
+    def _end_frame(self):
+        frame = self.current
+        self.frames.append(frame)
+        self.frame_number += 1
+        if self.export_file is not None:
+            total = sum(frame.values())
+            if self.export_json:
+                record = {stage: frame[stage] * 1000 for stage in self.STAGES}
+                record["frame"] = self.frame_number
+                record["total"] = total * 1000
+                self.export_file.write(json.dumps(record) + "\n")
+            else:
+                self.export_file.write(",".join(
+                    [str(self.frame_number)]
+                    + [f"{frame[stage] * 1000:.3f}" for stage in self.STAGES]
+                    + [f"{total * 1000:.3f}"]
+                ) + "\n")
+        if self.frame_number % self.OVERLAY_REFRESH == 0:
+            self.overlay_surface = None
+
+    def summary(self):
+        """(stage, average ms, worst ms) over the last HISTORY frames."""
+        frames = self.frames
+        rows = []
+        for stage in self.STAGES + ("total",):
+            if stage == "total":
+                times = [sum(frame.values()) for frame in frames]
+            else:
+                times = [frame[stage] for frame in frames]
+            rows.append((
+                stage, sum(times) / len(times) * 1000, max(times) * 1000
+            ))
+        return rows
+
+    def draw_overlay(self, screen):
+        """Draw the overlay if shown; returns its rect, or None."""
+        if not self.show_overlay or not self.frames:
+            return None
+        if self.overlay_surface is None:
+            font = TextElements.load_font(
+                resource_path("images/Bauhaus93.ttf"), 16
+            )
+            lines = [
+                font.render(
+                    f"{stage:<8} {average:6.2f} ms  worst {worst:6.2f}",
+                    True, (255, 255, 255),
+                )
+                for stage, average, worst in self.summary()
+            ]
+            height = sum(line.get_height() for line in lines) + 10
+            width = max(line.get_width() for line in lines) + 10
+            self.overlay_surface = pygame.Surface((width, height), SRCALPHA)
+            self.overlay_surface.fill((0, 0, 0, 160))
+            y = 5
+            for line in lines:
+                self.overlay_surface.blit(line, (5, y))
+                y += line.get_height()
+        rect = self.overlay_surface.get_rect(midtop=(WIDTH // 2, 10))
+        return screen.blit(self.overlay_surface, rect)
+
+    def close(self):
+        if self.export_file is not None:
+            self.export_file.close()
+            self.export_file = None
+
+PLATFORM_TYPES = {
+    "normal": NormalPlatform,
+    "cement": CementPlatform,
+    "ice": IcePlatform,
+}
+
+PLATFORM_FIELDS = {"type", "width", "height", "x", "y"}
+
+def platform_records(data):
+    """(type, width, height, x, y) of each platform in level file data."""
+    return [
+        (p["type"], p["width"], p["height"], p["x"], p["y"])
+        for p in data["platforms"]
+    ]
+
+def make_platform(record):
+    kind, width, height, x, y = record
+    return PLATFORM_TYPES[kind](width, height, x, y)
+
+class PlatformStreamer:
+    """Keeps platform sprites only for the x-chunks near the camera.
+
+    Platforms stay as plain (type, width, height, x, y) records and are
+    turned into sprites when the camera gets within MARGIN of a chunk they
+    overlap, then dropped again once it moves away.
+    """
+    MARGIN = WIDTH
+
+    def __init__(self, level, records, chunk_width):
+        self.level = level
+        self.records = records
+        self.chunk_width = chunk_width
+        self.chunks = [[] for _ in range(level.map_width // chunk_width + 1)]
+        for i, (_, width, _, x, _) in enumerate(records):
+            for chunk in self._chunk_range(x, x + width):
+                self.chunks[chunk].append(i)
+        self.loaded = range(0)
+        self.sprites = {}
+
+    def _chunk_range(self, left, right):
+        last = len(self.chunks) - 1
+        first_chunk = min(max(int(left) // self.chunk_width, 0), last)
+        last_chunk = min(max(int(right - 1) // self.chunk_width, 0), last)
+        return range(first_chunk, last_chunk + 1)
+
+    def update(self, camera_x_offset):
+        wanted = self._chunk_range(
+            camera_x_offset - self.MARGIN,
+            camera_x_offset + WIDTH + self.MARGIN,
+        )
+        if wanted == self.loaded:
+            return
+        for chunk in self.loaded:
+            if chunk in wanted:
+                continue
+            for i in self.chunks[chunk]:
+                _, width, _, x, _ = self.records[i]
+                span = self._chunk_range(x, x + width)
+                if (
+                    i in self.sprites
+                    and not (span.start < wanted.stop and wanted.start < span.stop)
+                ):
+                    self.level.remove_platform(self.sprites.pop(i))
+        for chunk in wanted:
+            if chunk in self.loaded:
+                continue
+            for i in self.chunks[chunk]:
+                if i not in self.sprites:
+                    self.sprites[i] = make_platform(self.records[i])
+                    self.level.add_platform(self.sprites[i])
+        self.loaded = wanted
+
+class PlatformBand:
+    """Platforms pre-drawn into a band wider than the screen.
+
+    While the camera stays inside the band, every visible platform costs
+    one blit between them. The band is redrawn around the camera when the
+    camera leaves it, or after invalidate().
+    """
+    MARGIN = WIDTH // 2
+    BAND_WIDTH = WIDTH + 2 * MARGIN
+
+    def __init__(self, platforms: SpatialGrid):
+        self.platforms = platforms
+        self.surface = None
+        self.invalidate()
+
+    def invalidate(self):
+        self.left = None
+
+    def _redraw(self, camera_x):
+        self.left = max(0, camera_x - self.MARGIN)
+        band = pygame.Rect(self.left, 0, self.BAND_WIDTH, HEIGHT)
+        # A new surface rather than clearing this one: frames waiting in
+        # a RenderThread may still be drawn from it
+        self.surface = pygame.Surface((self.BAND_WIDTH, HEIGHT), SRCALPHA)
+        # Run-length encoded, blits skip the empty space between platforms
+        self.surface.set_alpha(255, RLEACCEL)
+        for platform in self.platforms.query(band):
+            platform.blit(self.surface, self.left)
+
+    def blit(self, background_surface, camera_x_offset, view):
+        """Draw the platforms in view and return their screen rects."""
+        # Platforms move by the truncated camera offset, see Rect.move
+        camera_x = int(camera_x_offset)
+        if (
+            self.left is None or camera_x < self.left
+            or camera_x + WIDTH > self.left + self.BAND_WIDTH
+        ):
+            self._redraw(camera_x)
+        background_surface.blit(
+            self.surface, (0, 0), (camera_x - self.left, 0, WIDTH, HEIGHT)
+        )
+        screen = background_surface.get_rect()
+        return [
+            platform.rect.move(-camera_x, 0).clip(screen)
+            for platform in self.platforms.query(view)
+        ]
+
 class Level:
+    # Bullets pass through platforms and doors unless this is set
+    bullets_hit_obstacles = False
+    # Replaced by the game's profiler while a level is played
+    profiler = FrameProfiler()
+
     def __init__(
         self,
         name: str,
@@ -326,7 +1155,7 @@ class Level:
         map_width: int,
         spawn_x: int, spawn_y: int,
         goal_x: int, goal_y: int,
-        shadow_countdown: int,
+        shadow_countdown,
         health: int,
         key_door_pairs,
     ):
@@ -335,23 +1164,92 @@ class Level:
         self.map_width = map_width
         self.game_field = pygame.Rect(0, 0, map_width, HEIGHT)
         self.player = Player(spawn_x, spawn_y, map_width)
-        # The shadow is initially outside screen.
-        self.shadow = Shadow(-100, 0, shadow_countdown, self.player)
+        self.history = PlayerHistory()
+        self.all_bullets = BulletPool()
+        if isinstance(shadow_countdown, int):
+            shadow_countdown = (shadow_countdown,)
+        # The shadows are initially outside screen.
+        self.shadows = [
+            Shadow(-100, 0, countdown, self.player, self.history,
+                   self.all_bullets)
+            for countdown in shadow_countdown
+        ]
+        self.shadow = self.shadows[0]
         self.goal = Goal(goal_x, goal_y)
         self.health = self.initial_health = health
         self.key_door_pairs = key_door_pairs
         self.dirty = False
         self.won = False
+        self.camera_x_offset = 0
+        self.streamer = None
+        self.path = None  # set for levels loaded from a file
+        # Optional pre-drawn platforms, see PlatformBand
+        self.platform_band = None
 
         self.player.obstacles.extend(platforms)
         self.player.obstacles.extend(door for _, door in key_door_pairs)
         self.all_sprites = pygame.sprite.Group()
         for platform in platforms:
             self.all_sprites.add(platform)
-        self.all_sprites.add(self.player, self.shadow, self.goal)
-        self.all_bullets = self.shadow.all_bullets
+        self.all_sprites.add(self.player, *self.shadows, self.goal)
         self.add_keys_and_doors()
 
+        # Render layers, indexed so only what the camera sees gets drawn
+        self.background_sprites = SpatialGrid(map_width, platforms)
+        self.foreground_sprites = SpatialGrid(map_width, [self.goal])
+        for key, door in key_door_pairs:
+            self.foreground_sprites.extend((key, door))
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a level from a JSON file (see levels/).
+
+        Levels with a "chunk_width" only build the platforms near the
+        camera, for maps too wide to keep every platform sprite around.
+        """
+        with open(resource_path(path)) as f:
+            data = json.load(f)
+        records = platform_records(data)
+        chunk_width = data.get("chunk_width")
+        level = cls(
+            data["name"],
+            () if chunk_width else tuple(map(make_platform, records)),
+            data["map_width"],
+            *data["spawn"],
+            *data["goal"],
+            data["shadow_countdown"],
+            data["health"],
+            tuple(
+                (Key(*pair["key"]), Door(*pair["door"]))
+                for pair in data.get("key_doors", ())
+            ),
+        )
+        if chunk_width:
+            level.stream_platforms(records, chunk_width)
+        level.path = path
+        return level
+
+    def stream_platforms(self, records, chunk_width):
+        self.streamer = PlatformStreamer(self, records, chunk_width)
+        self.streamer.update(self.camera_for(self.player.pos.x))
+
+    def add_platform(self, platform):
+        self.player.obstacles.append(platform)
+        self.background_sprites.append(platform)
+        self.all_sprites.add(platform)
+        if self.platform_band is not None:
+            self.platform_band.invalidate()
+
+    def remove_platform(self, platform):
+        self.player.obstacles.remove(platform)
+        self.background_sprites.remove(platform)
+        self.all_sprites.remove(platform)
+        if self.platform_band is not None:
+            self.platform_band.invalidate()
+
+    def camera_for(self, x):
+        return min(max(0, x - WIDTH / 2), self.map_width - WIDTH)
+
     def add_keys_and_doors(self):
         for key, door in self.key_door_pairs:
             self.all_sprites.add(key, door)
@@ -365,7 +1263,11 @@ class Level:
     def reset(self):
         self.all_bullets.clear()
         self.player.reset()
-        self.shadow.reset()
+        if self.streamer is not None:
+            self.streamer.update(self.camera_for(self.player.pos.x))
+        self.history.clear()
+        for shadow in self.shadows:
+            shadow.reset()
         self.add_keys_and_doors()
         for key, door in self.key_door_pairs:
             if key.used:
@@ -373,24 +1275,32 @@ class Level:
                 key.reset()
                 door.reset()
 
-    def tick(self, background_surface):
+    def step(self, inputs: InputState = IDLE):
+        """Advance the simulation by one frame without touching the display."""
+        self._advance(inputs)
+        self._resolve(inputs)
+
+    def _advance(self, inputs):
+        """Move everything and the camera, the first half of step."""
         # Subroutine loops
-        self.player.physics()
-        self.shadow.track()
-        bullets_dead = []
-        for i in reversed(range(len(self.all_bullets))):
-            bullet: Bullet = self.all_bullets[i]
-            bullet.rect.move_ip(*bullet.vel)
-            if not bullet.rect.colliderect(self.game_field):
-                bullets_dead.append(i)
-        for i in bullets_dead:
-            self.all_bullets.pop(i)
+        profiler = self.profiler
+        self.player.physics(inputs)
+        profiler.mark("physics")
+        self.history.record(self.player)
+        for shadow in self.shadows:
+            shadow.track()
+        profiler.mark("shadow")
+        self.all_bullets.advance(self.game_field)
+        if self.bullets_hit_obstacles:
+            self.all_bullets.collide_obstacles(self.player.obstacles)
+        profiler.mark("bullets")
         # Camera
-        camera_x_offset = min(max(0, self.player.pos.x - WIDTH / 2),
-                              self.map_width - WIDTH)
-        # Render everything
-        for entity in chain(self.all_sprites, self.all_bullets):
-            entity.blit(background_surface, camera_x_offset)
+        self.camera_x_offset = self.camera_for(self.player.pos.x)
+        if self.streamer is not None:
+            self.streamer.update(self.camera_x_offset)
+
+    def _resolve(self, inputs):
+        """Pick up keys, die, win and shoot, the second half of step."""
         # Check if key is picked up
         for key, door in self.key_door_pairs:
             if not key.used and self.player.rect.colliderect(key.rect):
@@ -400,9 +1310,9 @@ class Level:
         # Check if player is dead
         if (
             self.player.is_in_void()
-            or self.player.rect.colliderect(self.shadow.rect)
+            or self.player.rect.collidelist(self.shadows) != -1
         ):
-            pygame.mixer.Sound.play(hitsound)
+            play_sound("hit")
             self.reset()
             self.health -= 1
         # Check if player won
@@ -410,260 +1320,903 @@ class Level:
             self.won = True
         # Check if player pressed shoot button
         if self.player.shooting:
-            mouse_pos = pygame.mouse.get_pos()
+            mouse_pos = inputs.aim
             player_pos = self.player.rect.center
-            self.all_bullets.append(Bullet(
+            self.all_bullets.fire(
                 *player_pos,
-                mouse_pos[0] + camera_x_offset, mouse_pos[1]
-            ))
+                mouse_pos[0] + self.camera_x_offset, mouse_pos[1]
+            )
+        self.profiler.mark("level")
 
-class Game:
-    def __init__(self, levels):
-        self.levels = levels
-        self.level_id = 0
-        self.title = "Nighttime Chase"
+    def render(self, background_surface, alpha=1.0):
+        """Draw the level and return the screen rects that were drawn.
+
+        alpha places moving sprites and the camera between the previous
+        and the current step, for renderers running faster than the
+        simulation.
+        """
+        if alpha >= 1:
+            camera_x_offset = self.camera_x_offset
+        else:
+            camera_x_offset = self.camera_for(
+                self.player.interpolated_pos(alpha).x
+            )
+        view = pygame.Rect(camera_x_offset, 0, WIDTH, HEIGHT)
+        if self.platform_band is not None:
+            drawn = self.platform_band.blit(
+                background_surface, camera_x_offset, view
+            )
+        else:
+            drawn = [
+                entity.blit(background_surface, camera_x_offset)
+                for entity in self.background_sprites.query(view)
+            ]
+        for entity in (self.player, *self.shadows):
+            drawn.append(entity.blit(background_surface, camera_x_offset, alpha))
+        for entity in self.foreground_sprites.query(view):
+            rect = entity.blit(background_surface, camera_x_offset)
+            if rect:
+                drawn.append(rect)
+        drawn.extend(self.all_bullets.blit(
+            background_surface, camera_x_offset, view, alpha
+        ))
+        self.profiler.mark("blit")
+        return drawn
+
+    def tick(self, background_surface, inputs: InputState = None):
+        if inputs is None:
+            inputs = InputState.from_pygame()
+        # Drawn between moving and the checks, as the game always did: a
+        # frame shows the player where it died and no bullet fired yet
+        self._advance(inputs)
+        drawn = self.render(background_surface)
+        self._resolve(inputs)
+        return drawn
+
+    @property
+    def finished(self) -> bool:
+        return self.won or self.health <= 0
+
+    def simulate(self, inputs, max_frames=None):
+        """Step the level headlessly, one tick per InputState in inputs.
+
+        Stops early when the level is won or lost. Returns the number of
+        frames simulated.
+        """
+        frames = 0
+        for state in inputs:
+            if max_frames is not None and frames >= max_frames:
+                break
+            self.step(state)
+            frames += 1
+            if self.finished:
+                break
+        return frames
+
+class LevelWatcher:
+    """Applies edits of a level file to the running Level, for --dev.
+
+    Platforms are diffed by their (type, width, height, x, y) record, so
+    saving the file only adds and removes the platforms that changed,
+    through Level.add_platform and remove_platform. Keys, doors and the
+    goal are moved in place and reindexed. The player carries on where
+    it is. Edits the level can't take in place (map width, shadows, the
+    number of keys, streamed levels) load it anew and copy the player,
+    health and picked up keys over.
+
+    A save is checked and its new sprites are built before the level is
+    touched, so a file that can't be loaded is reported and the level
+    kept as it is until the file is saved again. check_reload.py checks
+    this class against levels loaded from scratch.
+    """
+    POLL_INTERVAL = 0.25  # seconds between checks of the file's mtime
+
+    def __init__(self, level):
+        self.level = level
+        self.path = resource_path(level.path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+        self.rejected = None  # mtime of the last save that was not applied
+        self.next_poll = 0
+        with open(self.path) as f:
+            self._index_platforms(json.load(f))
+
+    def _index_platforms(self, data):
+        # Sprites of each record, and how many there are; streamed
+        # levels always load anew
+        self.platforms = {}
+        self.counts = Counter()
+        if self.level.streamer is None:
+            for record, platform in zip(platform_records(data), self.level.platforms):
+                self.platforms.setdefault(record, []).append(platform)
+                self.counts[record] += 1
+
+    def poll(self):
+        """Apply the file's changes if it was saved since the last poll.
+
+        Returns the level, which is a new one after a full reload.
+        """
+        now = perf_counter()
+        if now < self.next_poll:
+            return self.level
+        self.next_poll = now + self.POLL_INTERVAL
+        mtime = None
+        reloaded = None
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime in (self.mtime, self.rejected):
+                return self.level
+            with open(self.path) as f:
+                data = json.load(f)
+            self._check(data)
+            if self._needs_reload(data):
+                reloaded = Level.from_file(self.level.path)
+            else:
+                removed, added = self._platform_changes(data)
+                self._check_platforms(added)
+                built = [(record, make_platform(record)) for record in added.elements()]
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            # Saved halfway or with a typo: keep the level as it is
+            self.rejected = mtime
+            print(f"not reloading {self.path}: {error!r}", file=sys.stderr)
+            return self.level
+        if reloaded is not None:
+            self._carry_over(reloaded)
+            self._index_platforms(data)
+        else:
+            self._apply_platforms(removed, built)
+            self._apply(data)
+        self.mtime = mtime
+        return self.level
+
+    @staticmethod
+    def _is_point(value):
+        return (
+            isinstance(value, list) and len(value) == 2
+            and all(isinstance(v, (int, float)) for v in value)
+        )
+
+    @staticmethod
+    def _check_platforms(records):
+        for record in records:
+            kind, *size = record
+            if kind not in PLATFORM_TYPES:
+                raise ValueError(f"unknown platform type {kind!r}")
+            if not all(isinstance(v, (int, float)) for v in size):
+                raise ValueError(f"bad platform {record}")
+
+    @classmethod
+    def _check(cls, data):
+        """Raise ValueError for anything but the platforms the level
+        can't be built from; those are checked once they are diffed.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("not a JSON object")
+        countdowns = data["shadow_countdown"]
+        if isinstance(countdowns, int):
+            countdowns = (countdowns,)
+        if not (
+            isinstance(data["map_width"], int)
+            and all(isinstance(countdown, int) for countdown in countdowns)
+        ):
+            raise ValueError("bad map_width or shadow_countdown")
+        if not isinstance(data["name"], str) or not isinstance(data["health"], int):
+            raise ValueError("bad name or health")
+        for name in ("spawn", "goal"):
+            if not cls._is_point(data[name]):
+                raise ValueError(f"bad {name} {data[name]!r}")
+        for pair in data.get("key_doors", ()):
+            if not (
+                isinstance(pair, dict) and cls._is_point(pair.get("key"))
+                and cls._is_point(pair.get("door"))
+            ):
+                raise ValueError(f"bad key_doors entry {pair!r}")
+
+    def _needs_reload(self, data):
+        level = self.level
+        countdowns = data["shadow_countdown"]
+        if isinstance(countdowns, int):
+            countdowns = (countdowns,)
+        return (
+            level.streamer is not None or data.get("chunk_width")
+            or data["map_width"] != level.map_width
+            or list(countdowns)
+            != [shadow.initial_countdown for shadow in level.shadows]
+            or len(data.get("key_doors", ())) != len(level.key_door_pairs)
+        )
+
+    def _platform_changes(self, data):
+        """Platform records (removed, added) since the last applied save."""
+        wanted = Counter(platform_records(data))
+        removed, added = Counter(), Counter()
+        # Only records whose count differs, found by set operations
+        for record, _ in wanted.items() ^ self.counts.items():
+            difference = wanted[record] - self.counts[record]
+            if difference > 0:
+                added[record] = difference
+            elif difference < 0:
+                removed[record] = -difference
+        return removed, added
+
+    def _apply_platforms(self, removed, built):
+        level = self.level
+        for record in removed.elements():
+            platforms = self.platforms[record]
+            level.remove_platform(platforms.pop())
+            self.counts[record] -= 1
+            if not platforms:
+                del self.platforms[record], self.counts[record]
+        for record, platform in built:
+            self.platforms.setdefault(record, []).append(platform)
+            self.counts[record] += 1
+            level.add_platform(platform)
+
+    def _apply(self, data):
+        level = self.level
+        for (key, door), pair in zip(level.key_door_pairs, data.get("key_doors", ())):
+            self._move(key, pair["key"])
+            self._move(door, pair["door"])
+        self._move(level.goal, data["goal"])
+        level.player.initial_pos = tuple(data["spawn"])
+        level.name = data["name"]
+        level.initial_health = data["health"]
+
+    def _move(self, sprite, topleft):
+        topleft = tuple(topleft)
+        if topleft == sprite.initial_pos:
+            return
+        obstacles = self.level.player.obstacles
+        # Grids find sprites by the columns of their rect, so take the
+        # sprite out before moving it
+        blocking = sprite in obstacles
+        if blocking:
+            obstacles.remove(sprite)
+        self.level.foreground_sprites.remove(sprite)
+        sprite.initial_pos = topleft
+        sprite.rect.topleft = topleft
+        self.level.foreground_sprites.append(sprite)
+        if blocking:
+            obstacles.append(sprite)
+
+    def _carry_over(self, level):
+        """Make level, loaded anew, the watched one in place of the old."""
+        old = self.level
+        player, old_player = level.player, old.player
+        player.pos.update(old_player.pos)
+        player.previous_pos.update(old_player.previous_pos)
+        player.vel.update(old_player.vel)
+        player.turning_left = old_player.turning_left
+        player.shoot_cd = old_player.shoot_cd
+        player.rect.midbottom = player.pos
+        level.health = old.health
+        level.dirty = old.dirty
+        if old.platform_band is not None:
+            level.platform_band = PlatformBand(level.background_sprites)
+        for (old_key, _), (key, door) in zip(old.key_door_pairs, level.key_door_pairs):
+            if old_key.used:
+                key.on_picked_up()
+                door.on_unlocked()
+                player.obstacles.remove(door)
+        level.camera_x_offset = level.camera_for(player.pos.x)
+        if level.streamer is not None:
+            level.streamer.update(level.camera_x_offset)
+        self.level = level
+
+class DirtyRectTracker:
+    """Works out which parts of the screen changed since the last frame.
+
+    The background never changes, so only pixels under something drawn
+    this frame or the frame before can differ. When the camera jumps or
+    the changed area gets too large, update() returns None to ask for a
+    full display update instead.
+    """
+    MAX_SCROLL = WIDTH // 4
+    MAX_DIRTY_AREA = WIDTH * HEIGHT // 2
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self.previous = None
+        self.camera_x_offset = None
+
+    def update(self, drawn_rects, camera_x_offset, changed_rects=()):
+        previous = self.previous
+        previous_camera = self.camera_x_offset
+        self.previous = drawn_rects
+        self.camera_x_offset = camera_x_offset
+        if (
+            previous is None
+            or abs(camera_x_offset - previous_camera) > self.MAX_SCROLL
+        ):
+            return None
+        dirty = previous + drawn_rects
+        dirty.extend(changed_rects)
+        if sum(rect.w * rect.h for rect in dirty) > self.MAX_DIRTY_AREA:
+            return None
+        return dirty
+
+def blit_rects(source, dest, area, bounds):
+    """(source rect, screen rect) that Surface.blit would copy between.
+
+    The screen rect is clipped to bounds, as blit() returns it.
+    """
+    if area is None:
+        area = source.get_rect()
+    else:
+        area = source.get_rect().clip(area)
+    drawn = pygame.Rect(dest[0], dest[1], area.width, area.height)
+    return area, drawn.clip(bounds)
+
+class DrawList:
+    """One frame's blits, recorded for a RenderThread to draw.
+
+    Stands in for the screen in Level.render and the sprites' blit
+    methods: blit() returns the rect a real blit would have drawn and
+    keeps (surface, position, area) to draw later. Surfaces that end up
+    in a draw list are never drawn on again (atlas regions, cached text,
+    layers that are replaced rather than redrawn), so the list can be
+    drawn on another thread while the next frame is simulated.
+    """
+    def __init__(self, size=(WIDTH, HEIGHT)):
+        self.rect = pygame.Rect((0, 0), size)
+        self.commands = []
+        self.update_rects = None  # None updates the whole display
+
+    def get_width(self):
+        return self.rect.width
+
+    def get_rect(self):
+        return self.rect.copy()
+
+    def blit(self, source, dest, area=None):
+        self.commands.append((source, dest, area))
+        return blit_rects(source, dest, area, self.rect)[1]
+
+    def blits(self, blit_sequence, doreturn=True):
+        rects = [self.blit(*args) for args in blit_sequence]
+        return rects if doreturn else None
+
+class RenderThread:
+    """Draws and presents DrawLists on a thread of its own.
+
+    Frames go through a queue of one, so at most two are in flight: one
+    being drawn and one waiting. submit() only blocks when both slots
+    are taken. Blitting and updating the display release the GIL, so
+    the next frame is simulated while this one is put on screen.
+    """
+    def __init__(self, screen):
+        self.screen = screen
+        self.frames = queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, draw_list):
+        if self.error is not None:
+            raise RuntimeError("the render thread stopped") from self.error
+        self.frames.put(draw_list)
+
+    def wait(self):
+        """Block until every submitted frame is on screen."""
+        self.frames.join()
+
+    def _run(self):
+        while True:
+            draw_list = self.frames.get()
+            try:
+                if self.error is None:
+                    self.screen.blits(draw_list.commands, False)
+                    pygame.display.update(draw_list.update_rects)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.frames.task_done()
+
+class RendererScreen:
+    """The screen drawn through an SDL Renderer instead of a Surface.
+
+    Has the blit(), blits() and fill() that Images, ImageHorizontalTile,
+    TextElements and the scenes draw with, but copies textures: each
+    surface is uploaded once, the first time it is drawn, and regions of
+    the texture atlas share the atlas's texture. Like with DrawList,
+    surfaces drawn here are never drawn on again, so a texture never goes
+    stale. The game draws at WIDTH x HEIGHT and the renderer scales that
+    to the window, letterboxed.
+    """
+    def __init__(self, title, scale=1, software=False):
+        from pygame._sdl2 import video
+        self.video = video
+        self.window = video.Window(
+            title, size=(WIDTH * scale, HEIGHT * scale), resizable=True
+        )
+        self.renderer = video.Renderer(
+            self.window, accelerated=0 if software else -1
+        )
+        self.renderer.logical_size = (WIDTH, HEIGHT)
+        self.rect = pygame.Rect(0, 0, WIDTH, HEIGHT)
+        # Keyed by surface, dropped with it (old text, replaced layers)
+        self.textures = weakref.WeakKeyDictionary()
 
-    def run_level(self, level: Level):
+    def get_size(self):
+        return self.rect.size
+
+    def get_width(self):
+        return self.rect.width
+
+    def get_rect(self):
+        return self.rect.copy()
+
+    def texture(self, surface):
+        texture = self.textures.get(surface)
+        if texture is None:
+            texture = self.textures[surface] = self.video.Texture.from_surface(
+                self.renderer, surface
+            )
+        return texture
+
+    def blit(self, source, dest, area=None):
+        area, drawn = blit_rects(source, dest, area, self.rect)
+        if drawn:
+            x, y = source.get_abs_offset()
+            self.texture(source.get_abs_parent()).draw(
+                area.move(x, y), (dest[0], dest[1], area.width, area.height)
+            )
+        return drawn
+
+    def blits(self, blit_sequence, doreturn=True):
+        rects = [self.blit(*args) for args in blit_sequence]
+        return rects if doreturn else None
+
+    def fill(self, colour, rect=None):
+        rect = self.rect if rect is None else self.rect.clip(rect)
+        self.renderer.draw_color = pygame.Color(colour)
+        self.renderer.fill_rect(rect)
+        return rect
+
+    def present(self):
+        self.renderer.present()
+
+    def set_caption(self, caption):
+        self.window.title = caption
+
+    def to_logical(self, pos):
+        """Window coordinates, e.g. of the mouse, in game pixels."""
+        width, height = self.window.size
+        scale = min(width / WIDTH, height / HEIGHT)
+        return (
+            int((pos[0] - (width - WIDTH * scale) / 2) / scale),
+            int((pos[1] - (height - HEIGHT * scale) / 2) / scale),
+        )
+
+class Scene:
+    """One screen of the game, run by a SceneManager.
+
+    Scenes are built once and reused: enter() runs every time a scene
+    becomes current, then frame(screen), which every scene defines, once
+    per frame until it returns the scene to switch to.
+    """
+    fps = 60
+
+    def __init__(self, game):
+        self.game = game
+
+    def enter(self):
+        pass
+
+    def events(self):
+        """This frame's events; closing the window quits the game."""
+        events = pygame.event.get()
+        for event in events:
+            if event.type == QUIT:
+                self.game.quit()
+        return events
+
+class MenuScene(Scene):
+    """A heading and a prompt on the menu background; Space starts a run."""
+    def __init__(self, game, caption, heading, colour, prompt):
+        super().__init__(game)
+        self.caption = caption
+        self.heading = TextElements('images/Bauhaus93.ttf', 60, colour, heading, 400, 150)
+        self.prompt = TextElements('images/Bauhaus93.ttf', 40, (255,255,255), prompt, 400, 250)
+        self.rectangle = pygame.Rect(350, 300, 600, 60)
+        self.rectangle.center = (400, 250)
+
+    def enter(self):
+        if self.caption is None:
+            self.game.reset_caption()
+        else:
+            self.game.set_caption(f"{self.game.title} - {self.caption}")
+
+    def frame(self, screen):
+        for event in self.events():
+            if event.type == KEYDOWN and event.key == K_SPACE:
+                self.game.hard_reset()
+                return self.game.play(0)
+        background = self.game.menu_background
+        screen.blit(background.image, background.rect)
+        screen.fill((0,0,0), self.rectangle)
+        screen.blit(self.prompt.text, self.prompt.rect)
+        screen.blit(self.heading.text, self.heading.rect)
+        self.game.scenes.present()
+        self.game.scenes.clock.tick(self.fps)
+
+class LevelScene(Scene):
+    """Plays game.level_scene.level until it is won or lost.
+
+    The background and HUD only change with the level or its health, so
+    they are composed once into static_layer and each frame starts from
+    a copy of it. With dirty rects only the parts of the layer under the
+    previous frame's sprites are copied back.
+
+    When the game is pipelined, frames are recorded into a DrawList and
+    drawn by the scene manager's RenderThread instead.
+    """
+    def __init__(self, game):
+        super().__init__(game)
+        self.level = None
+        self.lives = TextElements('images/Bauhaus93.ttf', 30, (255,255,255), "", 70, 50)
+        self.level_name = TextElements('images/Bauhaus93.ttf', 30, (255,255,255), "", 730, 50)
+        self.tracker = DirtyRectTracker()
+        self.static_layer = None
+        self.static_key = None
+
+    @property
+    def fps(self):
+        return self.game.fps
+
+    def enter(self):
+        level = self.level
         if level.dirty:
             level.hard_reset()
         level.dirty = True
-        pygame.display.set_caption(f"{self.title} - {level.name}")
-        background_surface = pygame.display.set_mode((WIDTH, HEIGHT))
-        clock = pygame.time.Clock()
-        FPS = 60
-
-        Map = Images('images/GameScreen.png', 0, 0, 800, 600)
+        self.game.set_caption(f"{self.game.title} - {level.name}")
+        self.static_key = None
+        self.tracker.invalidate()
+        if self.game.platform_cache and level.platform_band is None:
+            level.platform_band = PlatformBand(level.background_sprites)
+        if self.game.recorder is not None:
+            self.game.recorder.start_level(level)
+        level.profiler = self.game.profiler
+        # Fixed-timestep loop: the level always advances TICK_RATE steps
+        # per second of wall time, however fast frames are drawn
+        self.step_time = 1 / TICK_RATE
+        self.accumulator = self.step_time
+        self.previous_time = perf_counter()
+
+    def frame(self, screen):
+        game, level, tracker = self.game, self.level, self.tracker
+        profiler = game.profiler
+        pipelined = game.scenes.render_thread is not None
+        if pipelined:
+            screen = DrawList(screen.get_size())
+        step_time = self.step_time
+        profiler.start_frame()
+
+        for event in self.events():
+            if event.type == KEYDOWN and event.key == K_F3:
+                profiler.toggle_overlay()
+                tracker.invalidate()
+        watcher = game.watchers.get(game.level_id)
+        if watcher is not None and watcher.poll() is not level:
+            # Reloaded as a new level
+            level = self.level = game.levels[game.level_id] = watcher.level
+            level.profiler = profiler
+            self.static_key = None
+
+        now = perf_counter()
+        self.accumulator += now - self.previous_time
+        self.previous_time = now
+        inputs = InputState.from_pygame()
+        if game.renderer:
+            # The mouse is in window pixels, the window may be scaled
+            inputs = inputs._replace(aim=screen.to_logical(inputs.aim))
+        profiler.mark("input")
+        steps = 0
+        while self.accumulator >= step_time and not level.finished:
+            if game.recorder is not None:
+                game.recorder.record(inputs)
+            level.step(inputs)
+            if game.publisher is not None:
+                game.publisher.publish(level)
+            self.accumulator -= step_time
+            steps += 1
+            if steps == MAX_STEPS_PER_FRAME:
+                # Too far behind: drop the backlog rather than spiral
+                self.accumulator = min(self.accumulator, step_time)
+                break
 
+        static_key = (level.name, level.health)
+        if static_key != self.static_key:
+            self.compose_static_layer(level)
+            self.static_key = static_key
+            tracker.invalidate()
+        previous = tracker.previous if game.dirty_rects else None
+        if previous is None:
+            screen.blit(self.static_layer, (0, 0))
+        else:
+            # Everywhere else the screen still shows the static layer
+            layer = self.static_layer
+            screen.blits([(layer, rect, rect) for rect in previous], False)
+        profiler.mark("hud")
+        alpha = 1.0 if level.finished else self.accumulator / step_time
+        drawn = level.render(screen, alpha)
+        overlay_rect = profiler.draw_overlay(screen)
+        if overlay_rect is not None:
+            drawn.append(overlay_rect)
+        profiler.mark("hud")
+        rects = None
+        if game.dirty_rects:
+            rects = tracker.update(drawn, level.camera_x_offset)
+        game.scenes.present(rects, screen if pipelined else None)
+        profiler.mark("display")
+        game.scenes.clock.tick(self.fps)
+        profiler.mark("wait")
+        profiler.end_frame()
+
+        if not level.finished:
+            return None
+        if game.recorder is not None:
+            game.recorder.finish_level(level)
+        if level.health <= 0:
+            play_sound("game_over")
+            return game.game_over_scene
+        play_sound("win")
+        if game.level_id + 1 == len(game.levels):
+            # Beat the game!
+            return game.victory_scene
+        return game.play(game.level_id + 1)
+
+    def compose_static_layer(self, level):
+        self.lives.set_text(f"LIVES: {level.health}")
+        self.level_name.set_text(level.name)
+        # A new surface each time, frames waiting in a RenderThread may
+        # still be drawn from the old one
+        layer = self.static_layer = display_format(pygame.Surface((WIDTH, HEIGHT)))
+        background = self.game.game_background
+        layer.blit(background.image, background.rect)
+        layer.blit(self.lives.text, self.lives.rect)
+        layer.blit(self.level_name.text, self.level_name.rect)
+
+class SceneManager:
+    """Runs one Scene at a time on a display created once.
+
+    Switching scenes only calls enter() on the next one, so no window,
+    image or font is recreated. The time from each switch to the first
+    display update of the new scene is kept in transition_times, and
+    on_transition is called after each one is measured.
+
+    With pipelined set, scenes may present DrawLists, which a
+    RenderThread draws while the next frame is being simulated.
+    """
+    def __init__(self, screen, pipelined=False):
+        self.screen = screen
+        self.render_thread = RenderThread(screen) if pipelined else None
+        self.clock = pygame.time.Clock()
+        self.scene = None
+        self.switched_at = None
+        self.transition_times = deque(maxlen=100)
+        self.first_frame_at = None
+        self.on_first_frame = None  # called after the first display update
+        self.on_transition = None
+
+    def switch(self, scene):
+        # The first scene is covered by the startup time instead
+        if self.scene is not None:
+            self.switched_at = perf_counter()
+        self.wait()
+        self.scene = scene
+        scene.enter()
+
+    def wait(self):
+        """Let the render thread finish, before drawing on the screen."""
+        if self.render_thread is not None:
+            self.render_thread.wait()
+
+    def present(self, rects=None, draw_list=None):
+        """Update the display, or only rects of it.
+
+        A draw_list is handed to the render thread, which draws it and
+        updates the display later. A RendererScreen always presents
+        the whole frame.
+        """
+        if isinstance(self.screen, RendererScreen):
+            self.screen.present()
+        elif draw_list is None:
+            pygame.display.update(rects)
+        else:
+            draw_list.update_rects = rects
+            self.render_thread.submit(draw_list)
+        if self.switched_at is not None:
+            self.transition_times.append(perf_counter() - self.switched_at)
+            self.switched_at = None
+            if self.on_transition is not None:
+                self.on_transition()
+        if self.first_frame_at is None:
+            self.first_frame_at = perf_counter()
+            if self.on_first_frame is not None:
+                self.on_first_frame()
+
+    def run(self, scene):
+        self.switch(scene)
         while True:
-            
-            LivesRemaining = TextElements('images/Bauhaus93.ttf', 30, (255,255,255),f"LIVES: {level.health}", 70, 50)
-            CurrentLevel = TextElements('images/Bauhaus93.ttf', 30, (255,255,255),f"{level.name}", 730, 50)
-
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-            background_surface.blit(Map.image, Map.rect)
-            background_surface.blit(LivesRemaining.text, LivesRemaining.rect)
-            background_surface.blit(CurrentLevel.text, CurrentLevel.rect)
-            level.tick(background_surface)
-            pygame.display.update()
-            clock.tick(FPS)
-
-            if level.health <= 0:
-                pygame.mixer.Sound.play(GameOverSound)
-                return False
-            if level.won:
-                pygame.mixer.Sound.play(GameWinSound)
-                return True
+            next_scene = self.scene.frame(self.screen)
+            if next_scene is not None:
+                self.switch(next_scene)
+
+class Game:
+    def __init__(
+        self, levels, dirty_rects=False, recorder=None, profiler=None, fps=60,
+        platform_cache=False, report_startup=False, pipelined=False,
+        publisher=None, renderer=False, window_scale=1, software_renderer=False,
+        hot_reload=False,
+    ):
+        # Level objects, or paths of level files loaded when first played
+        self.levels = list(levels)
+        # Receives every level run's input, see replay.InputRecorder
+        self.recorder = recorder
+        # Receives every tick's level state, see spectate.StatePublisher
+        self.publisher = publisher
+        # Draw through an SDL Renderer in a window_scale times larger
+        # window, see RendererScreen
+        if renderer and (dirty_rects or pipelined):
+            raise ValueError("the renderer always draws whole frames on this thread")
+        self.renderer = renderer
+        self.window_scale = window_scale
+        self.software_renderer = software_renderer
+        # Apply edits of level files while they are played, see
+        # LevelWatcher
+        self.hot_reload = hot_reload
+        self.watchers = {}
+        # Only push changed screen regions, for machines where a full
+        # display update is expensive
+        self.dirty_rects = dirty_rects
+        # Per-stage frame timings; F3 toggles the overlay while playing
+        self.profiler = profiler if profiler is not None else FrameProfiler()
+        # Frames drawn per second while playing; the simulation itself
+        # always runs at TICK_RATE
+        self.fps = fps
+        # Draw platforms from a pre-drawn band, see PlatformBand
+        self.platform_cache = platform_cache
+        # Print how long the first frame took to show
+        self.report_startup = report_startup
+        # Draw and present each frame on a render thread while the next
+        # one is simulated, see RenderThread
+        self.pipelined = pipelined
+        self.level_id = 0
+        self.title = "Nighttime Chase"
+        self.scenes = None
+        self.screen = None
+        self.loader = None
+        self.game_background = None
+
+    def get_level(self, level_id) -> Level:
+        level = self.levels[level_id]
+        if isinstance(level, str):
+            level = self.levels[level_id] = Level.from_file(level)
+            if self.hot_reload:
+                self.watchers[level_id] = LevelWatcher(level)
+        return level
+
+    def play(self, level_id):
+        """The level scene, set up to play level level_id."""
+        self.finish_loading()
+        self.level_id = level_id
+        self.level_scene.level = self.get_level(level_id)
+        return self.level_scene
+
+    def finish_loading(self):
+        """Wait for the asset loader and pack the texture atlas, once."""
+        if self.game_background is not None:
+            return
+        if self.loader is not None:
+            self.loader.join()
+        TextureAtlas.build()
+        self.game_background = Images('images/GameScreen.png', 0, 0, 800, 600)
+
+    def print_startup_time(self):
+        elapsed = self.scenes.first_frame_at - STARTED
+        print(f"first frame {elapsed * 1000:.0f}ms after startup", file=sys.stderr)
+
+    def print_transition_time(self):
+        times = sorted(self.scenes.transition_times)
+        print(
+            f"scene switch {self.scenes.transition_times[-1] * 1000:.1f}ms"
+            f" (median {times[len(times) // 2] * 1000:.1f}ms,"
+            f" worst {times[-1] * 1000:.1f}ms of {len(times)})",
+            file=sys.stderr,
+        )
+
+    def quit(self):
+        if self.scenes is not None:
+            self.scenes.wait()
+        self.profiler.close()
+        pygame.quit()
+        sys.exit()
+
+    def set_caption(self, caption):
+        if isinstance(self.screen, RendererScreen):
+            self.screen.set_caption(caption)
+        else:
+            pygame.display.set_caption(caption)
 
     def reset_caption(self):
-        pygame.display.set_caption(self.title)
-
-    def victory_screen(self):
-        pygame.display.set_caption(f"{self.title} - You beat the game!!")
-        background_surface = pygame.display.set_mode((WIDTH, HEIGHT))
-        clock = pygame.time.Clock()
-        FPS = 60
-        Map = Images('images/MenuScreen.png', 0, 0, 800, 600)
-        playbutton = TextElements('images/Bauhaus93.ttf',40, (255,255,255),"Press Space to Replay",400,250)
-        NameGame = TextElements('images/Bauhaus93.ttf',60, (0,255,0),"You Win!!",400,150)
-        rectangle = pygame.Rect(350, 300,600,60)
-        rectangle.center = (400,250)
-        while True:
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    pygame.quit()
-                    sys.exit()
-            pressed_keys = pygame.key.get_pressed()
-            if pressed_keys[K_SPACE]:
-                break
-            background_surface.blit(Map.image, Map.rect)
-            pygame.draw.rect(background_surface,(0,0,0),rectangle)
-            background_surface.blit(playbutton.text, playbutton.rect)
-            background_surface.blit(NameGame.text, NameGame.rect)
-            pygame.display.update()
-            clock.tick(FPS)
-
-    def game_over_screen(self):
-        pygame.display.set_caption(f"{self.title} - Game Over!")
-        background_surface = pygame.display.set_mode((WIDTH, HEIGHT))
-        clock = pygame.time.Clock()
-        FPS = 60
-        Map = Images('images/MenuScreen.png', 0, 0, 800, 600)
-        playbutton = TextElements('images/Bauhaus93.ttf',40, (255,255,255),"Press Space to Replay",400,250)
-        NameGame = TextElements('images/Bauhaus93.ttf',60, (255,0,0),"You Lose",400,150)
-        rectangle = pygame.Rect(350, 300,600,60)
-        rectangle.center = (400,250)
-        while True:
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    pygame.quit()
-                    sys.exit()
-            pressed_keys = pygame.key.get_pressed()
-            if pressed_keys[K_SPACE]:
-                break
-            background_surface.blit(Map.image, Map.rect)
-            pygame.draw.rect(background_surface,(0,0,0),rectangle)
-            background_surface.blit(playbutton.text, playbutton.rect)
-            background_surface.blit(NameGame.text, NameGame.rect)
-            pygame.display.update()
-            clock.tick(FPS)
+        self.set_caption(self.title)
 
     def hard_reset(self):
         self.reset_caption()
         self.level_id = 0
 
     def main(self):
-        pygame.font.init()
+        pygame.init()
         self.reset_caption()
-        background_surface = pygame.display.set_mode((WIDTH, HEIGHT))
-
-        clock = pygame.time.Clock()
-        FPS = 60
-
-        Map = Images('images/MenuScreen.png', 0, 0, 800, 600)
-        playbutton = TextElements('images/Bauhaus93.ttf', 40, (255,255,255),"Press Space to Play",400,250)
-        NameGame = TextElements('images/Bauhaus93.ttf', 60, (255,255,255),self.title,400,150)
-        rectangle = pygame.Rect(350, 300, 600, 60)
-        rectangle.center = (400, 250)
+        # The display, images and fonts are created once and shared by
+        # every scene
+        if self.renderer:
+            screen = RendererScreen(
+                self.title, self.window_scale, self.software_renderer
+            )
+        else:
+            screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.screen = screen
+        ImageHorizontalTile.convert_strips()
+        # Sounds and textures decode while the menu is already up; the
+        # atlas is packed when the first level starts
+        self.loader = threading.Thread(target=preload_assets, daemon=True)
+        self.loader.start()
+        self.menu_background = Images('images/MenuScreen.png', 0, 0, 800, 600)
+
+        self.title_scene = MenuScene(self, None, self.title, (255,255,255), "Press Space to Play")
+        self.victory_scene = MenuScene(self, "You beat the game!!", "You Win!!", (0,255,0), "Press Space to Replay")
+        self.game_over_scene = MenuScene(self, "Game Over!", "You Lose", (255,0,0), "Press Space to Replay")
+        self.level_scene = LevelScene(self)
 
         self.level_id = 0
-
-        while True:
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == KEYDOWN and event.key == K_SPACE:
-                    while True:
-                        won = self.run_level(self.levels[self.level_id])
-                        if won:
-                            self.level_id += 1
-                            if self.level_id == len(self.levels):
-                                # Beat the game!
-                                self.victory_screen()
-                                self.hard_reset()
-                        else:
-                            self.game_over_screen()
-                            self.hard_reset()
-            background_surface.blit(Map.image, Map.rect)
-            pygame.draw.rect(background_surface,(0,0,0),rectangle)
-            background_surface.blit(playbutton.text, playbutton.rect)
-            background_surface.blit(NameGame.text, NameGame.rect)
-
-            pygame.display.update()
-            clock.tick(FPS)
-
-Level_1 = Level(
-    "LEVEL 1",
-    (
-        NormalPlatform(1500, 30, 0, HEIGHT - 30),
-        NormalPlatform(700, 30, 1800, HEIGHT - 30),
-        NormalPlatform(400, 30, 2800, HEIGHT - 30),
-        NormalPlatform(75,100,400,HEIGHT - 130),
-        NormalPlatform(75,100,1000,HEIGHT - 130),
-        NormalPlatform(75,200,1200,HEIGHT - 230),
-        NormalPlatform(75,100,2425,HEIGHT - 130),
-        NormalPlatform(75,100,2800,HEIGHT - 130),
-    ),
-    3200,
-    50, 450,
-    3100, HEIGHT - 120,
-    100,
-    3,
-    ()
-)
-
-Level_2 = Level(
-    "LEVEL 2",
-    (
-        NormalPlatform(300, 30, 0, HEIGHT - 31),
-        CementPlatform(500, 30, 300, HEIGHT - 30),
-        CementPlatform(475, 30, 1100, HEIGHT - 30),
-        CementPlatform(75, 100, 1300, HEIGHT - 130),
-        CementPlatform(75, 200, 1500, HEIGHT - 230),
-        CementPlatform(200, 30, 1700, HEIGHT - 300),
-        CementPlatform(600, 30, 2400, HEIGHT - 30),
-    ),
-    3000,
-    50, 450,
-    2900, HEIGHT - 120,
-    100,
-    3,
-    ()
-)
-
-Level_3 = Level(
-    "LEVEL 3",
-    (
-        NormalPlatform(300, 30, 0, HEIGHT - 31),
-        IcePlatform(300, 30, 300, HEIGHT - 30),
-        IcePlatform(500, 30, 950, HEIGHT - 30),
-        IcePlatform(500, 30, 1670, HEIGHT - 120),
-        IcePlatform(500, 30, 950, HEIGHT - 210),
-        IcePlatform(500, 30, 1670, HEIGHT - 300),
-        NormalPlatform(550, 30, 2750, HEIGHT - 30),
-    ),
-    3200,
-    50, 450,
-    3100, HEIGHT - 120,
-    100,
-    3,
-    ()
-)
-
-Level_4 = Level(
-    "LEVEL 4",
-    (
-        NormalPlatform(500, 30, 0, HEIGHT - 31),
-        NormalPlatform(300, 30, 0, HEIGHT - 330),
-        NormalPlatform(300, 30, 800, HEIGHT - 30),
-        NormalPlatform(300, 30, 1300, HEIGHT - 110),
-        NormalPlatform(300, 30, 1800, HEIGHT - 190),
-        NormalPlatform(300, 30, 2300, HEIGHT - 270),
-        NormalPlatform(300, 30, 1800, HEIGHT - 350),
-        NormalPlatform(300, 30, 1300, HEIGHT - 350),
-        NormalPlatform(300, 30, 800, HEIGHT - 350),
-        NormalPlatform(200, 30, 500, HEIGHT - 270),
-        NormalPlatform(350, 30, 2850, HEIGHT - 30),
-    ),
-    3200,
-    50, 450,
-    3100, HEIGHT - 120,
-    100,
-    3,
-    (
-        (Key(100, HEIGHT - 380), Door(3010, HEIGHT - 180)),
-    )
-)
-
-Level_5 = Level(
-    "LEVEL 5",
-    (
-        NormalPlatform(300, 30, 0, HEIGHT - 31),
-        CementPlatform(300, 30, 300, HEIGHT - 30),
-        NormalPlatform(400, 30, 000, HEIGHT - 270),
-        NormalPlatform(200, 30, 790, HEIGHT - 110),
-        IcePlatform(100, 30, 1200, HEIGHT - 190),
-        IcePlatform(200, 30, 750, HEIGHT - 270),
-        CementPlatform(200, 30, 550, HEIGHT - 270),
-        IcePlatform(200, 30, 1200, HEIGHT - 350),
-        IcePlatform(200, 30, 1650, HEIGHT - 420),
-        CementPlatform(300, 30, 2450, HEIGHT - 30),
-        CementPlatform(300, 30, 2900, HEIGHT - 110),
-        CementPlatform(300, 30, 3350, HEIGHT - 190),
-        CementPlatform(300, 30, 3800, HEIGHT - 270),
-        NormalPlatform(600, 30, 4500, HEIGHT - 30),
-    ),
-    5000,
-    50, 450,
-    4900, HEIGHT - 120,
-    100,
-    3,
-    (
-        (Key(100, HEIGHT - 380), Door(4820, HEIGHT - 180)),
-    )
-)
-Game((Level_1, Level_2, Level_3, Level_4, Level_5)).main()
+        self.scenes = SceneManager(screen, pipelined=self.pipelined)
+        if self.report_startup:
+            self.scenes.on_first_frame = self.print_startup_time
+            self.scenes.on_transition = self.print_transition_time
+        self.scenes.run(self.title_scene)
+
+LEVEL_FILES = tuple(f"levels/level_{i}.json" for i in range(1, 6))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only update the changed parts of the screen")
+    parser.add_argument("--fps", type=int, default=60,
+                        help="frames drawn per second, e.g. 30, 60 or 144")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write per-frame stage timings to a .csv or .jsonl file")
+    parser.add_argument("--platform-cache", action="store_true",
+                        help="draw platforms from a pre-drawn band around the camera")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print how long the first frame and each scene switch took to show")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="draw each frame on a render thread while the next is simulated")
+    parser.add_argument("--renderer", action="store_true",
+                        help="draw with an SDL Renderer and textures instead of blitting")
+    parser.add_argument("--software-renderer", action="store_true",
+                        help="with --renderer, use SDL's software renderer")
+    parser.add_argument("--window-scale", type=int, default=1,
+                        help="with --renderer, window size as a multiple of 800x600")
+    parser.add_argument("--dev", action="store_true",
+                        help="apply changes to the level files while playing")
+    args = parser.parse_args(argv)
+    if args.renderer and (args.dirty_rects or args.pipelined):
+        parser.error("--renderer cannot be combined with --dirty-rects or --pipelined")
+    Game(
+        LEVEL_FILES,
+        dirty_rects=args.dirty_rects,
+        fps=args.fps,
+        platform_cache=args.platform_cache,
+        report_startup=args.startup_time,
+        pipelined=args.pipelined,
+        renderer=args.renderer,
+        window_scale=args.window_scale,
+        software_renderer=args.software_renderer,
+        hot_reload=args.dev,
+        profiler=FrameProfiler(export_path=args.profile) if args.profile else None,
+    ).main()
+
+if __name__ == "__main__":
+    main()
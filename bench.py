@@ -0,0 +1,272 @@
+"""Headless benchmarks for the game simulation and rendering.
+
+Every scenario times one operation per sample and reports p50/p99/mean
+in microseconds as JSON, so results from two commits can be diffed.
+
+    python bench.py                      # all scenarios, JSON to stdout
+    python bench.py -o before.json       # write to a file
+    python bench.py -k physics -k tick   # only scenarios matching these
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import pygame
+
+import Code
+
+Code.muted = True
+
+PLATFORM_COUNTS = (10, 100, 1000, 10000, 100000)
+BULLET_COUNTS = (10, 100, 500)
+
+def synthetic_level(platform_count, chunk_width=None):
+    """A flat run of short platforms with 20px gaps, spawn in the middle.
+
+    With chunk_width the platforms are streamed instead of built upfront.
+    """
+    spacing = 120
+    map_width = platform_count * spacing + Code.WIDTH
+    records = [
+        ("normal", 100, 30, i * spacing, Code.HEIGHT - 30)
+        for i in range(platform_count)
+    ]
+    spawn_x = platform_count * spacing // 2
+    level = Code.Level(
+        f"SYNTHETIC {platform_count}",
+        () if chunk_width else tuple(map(Code.make_platform, records)),
+        map_width,
+        spawn_x, Code.HEIGHT - 30,
+        map_width - 100, Code.HEIGHT - 120,
+        100,
+        3,
+        ()
+    )
+    if chunk_width:
+        level.stream_platforms(records, chunk_width)
+    return level
+
+def scripted_input(frame):
+    """Run right, jumping and shooting now and then."""
+    return Code.InputState(
+        right=True,
+        jump=frame % 90 < 10,
+        shoot=frame % 45 == 0,
+        aim=(600, 300),
+    )
+
+def samples_of(operation, count, before=None):
+    """Time count calls of operation(i); before(i) runs untimed."""
+    samples = []
+    clock = time.perf_counter_ns
+    for i in range(count):
+        if before is not None:
+            before(i)
+        start = clock()
+        operation(i)
+        samples.append(clock() - start)
+    return samples
+
+def summarize(samples):
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        "samples": len(ordered),
+        "p50_us": ordered[last // 2] / 1000,
+        "p99_us": ordered[last * 99 // 100] / 1000,
+        "mean_us": sum(ordered) / len(ordered) / 1000,
+    }
+
+def bundled_levels():
+    for path in Code.LEVEL_FILES:
+        yield os.path.splitext(os.path.basename(path))[0], path
+
+# Each bench_* yields (scenario name, function(frames) -> samples) so
+# filtered-out scenarios never build their levels.
+
+def physics_scenario(make_level):
+    def run(frames):
+        player = make_level().player
+
+        def before(i):
+            if player.is_in_void():
+                player.reset()
+
+        return samples_of(
+            lambda i: player.physics(scripted_input(i)), frames, before
+        )
+    return run
+
+def bench_physics():
+    for name, path in bundled_levels():
+        yield f"physics/{name}", physics_scenario(
+            lambda path=path: Code.Level.from_file(path)
+        )
+    for count in PLATFORM_COUNTS:
+        yield f"physics/synthetic_{count}", physics_scenario(
+            lambda count=count: synthetic_level(count)
+        )
+
+def bench_shadow():
+    run_right = Code.InputState(right=True)
+
+    def shadow_level():
+        level = synthetic_level(1000)
+
+        def before(i):
+            level.player.physics(run_right)
+            level.history.record(level.player)
+        return level, before
+
+    def track(frames):
+        level, before = shadow_level()
+        return samples_of(lambda i: level.shadow.track(), frames, before)
+
+    def blit(frames):
+        level, record = shadow_level()
+        shadow = level.shadow
+        # Follow from the first frame, with the camera on the player so
+        # the shadow is drawn on screen rather than clipped away
+        shadow.countdown = 0
+
+        def before(i):
+            record(i)
+            shadow.track()
+            level.camera_x_offset = level.camera_for(level.player.pos.x)
+
+        surface = pygame.display.get_surface()
+        return samples_of(
+            lambda i: shadow.blit(surface, level.camera_x_offset),
+            frames,
+            before,
+        )
+
+    yield "shadow/track", track
+    yield "shadow/blit", blit
+
+def bench_bullets():
+    def update_scenario(count):
+        def run(frames):
+            level = synthetic_level(1000)
+            bullets = level.all_bullets
+            x, y = level.player.rect.center
+
+            def before(i):
+                # Keep the pool topped up as bullets leave the field
+                while len(bullets) < count:
+                    aim = pygame.math.Vector2.from_polar(
+                        (100, len(bullets) * 37)
+                    )
+                    bullets.fire(x, y, x + aim.x, y + aim.y)
+
+            def update(i):
+                level.history.record(level.player)
+                for shadow in level.shadows:
+                    shadow.track()
+                bullets.advance(level.game_field)
+
+            return samples_of(update, frames, before)
+        return run
+
+    for count in BULLET_COUNTS:
+        yield f"bullets/update_{count}", update_scenario(count)
+
+def bench_tiles():
+    def blit_scenario(width):
+        def run(frames):
+            surface = pygame.display.get_surface()
+            tile = Code.NormalPlatform(width, 30, 0, Code.HEIGHT - 30)
+            scroll = max(1, width - Code.WIDTH)
+            return samples_of(
+                lambda i: tile.blit(surface, i * 7 % scroll), frames
+            )
+        return run
+
+    for width in (300, 1500, 100000):
+        yield f"tiles/blit_{width}", blit_scenario(width)
+
+def tick_scenario(make_level):
+    def run(frames):
+        surface = pygame.display.get_surface()
+        level = make_level()
+
+        def before(i):
+            if level.finished:
+                level.hard_reset()
+
+        return samples_of(
+            lambda i: level.tick(surface, scripted_input(i)), frames, before
+        )
+    return run
+
+def bench_tick():
+    for name, path in bundled_levels():
+        yield f"tick/{name}", tick_scenario(
+            lambda path=path: Code.Level.from_file(path)
+        )
+    for count in PLATFORM_COUNTS:
+        yield f"tick/synthetic_{count}", tick_scenario(
+            lambda count=count: synthetic_level(count)
+        )
+    for count in PLATFORM_COUNTS:
+        yield f"tick/streamed_{count}", tick_scenario(
+            lambda count=count: synthetic_level(count, chunk_width=1024)
+        )
+
+BENCHMARKS = (bench_physics, bench_shadow, bench_bullets, bench_tiles,
+              bench_tick)
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    parser.add_argument("-k", "--filter", action="append", default=[],
+                        help="only run scenarios whose name contains this")
+    parser.add_argument("-n", "--frames", type=int, default=1000,
+                        help="samples per scenario")
+    args = parser.parse_args(argv)
+
+    pygame.display.set_mode((Code.WIDTH, Code.HEIGHT))
+    Code.ImageHorizontalTile.convert_strips()
+    Code.TextureAtlas.build()
+
+    results = {}
+    for benchmark in BENCHMARKS:
+        for name, run in benchmark():
+            if args.filter and not any(f in name for f in args.filter):
+                continue
+            results[name] = summary = summarize(run(args.frames))
+            print(f"{name:<28} p50 {summary['p50_us']:>9.2f}us"
+                  f"  p99 {summary['p99_us']:>9.2f}us", file=sys.stderr)
+
+    report = json.dumps({
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "frames": args.frames,
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
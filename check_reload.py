@@ -0,0 +1,290 @@
+"""Checks of --dev level reloading against levels loaded from scratch.
+
+Every bundled level is copied to a scratch file, played for a while,
+then edited and saved. After LevelWatcher.poll the running level must be
+laid out like Level.from_file of the saved file, with the player where
+it was, and the two must then play the same ticks. Saves the game can't
+load must be reported and leave the running level as it was.
+
+    python check_reload.py               # exits 1 on a mismatch
+    python check_reload.py -k level_4    # only levels matching this
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+
+import pygame
+
+import Code
+from golden import running_input
+
+Code.muted = True
+
+PLAYED = 150  # ticks played before each edit
+REPLAYED = 600  # ticks both levels play after it
+SYNTHETIC_PLATFORMS = 10000
+
+def dumps(data):
+    """data laid out like the bundled level files, one entry per line."""
+    lines = []
+    for name, value in data.items():
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            entries = ",\n".join(f"    {json.dumps(entry)}" for entry in value)
+            lines.append(f'  "{name}": [\n{entries}\n  ]')
+        else:
+            lines.append(f'  "{name}": {json.dumps(value)}')
+    return "{\n" + ",\n".join(lines) + "\n}\n"
+
+# Edits the running level must take, each changing level file data
+def move_platform(data):
+    data["platforms"][1]["x"] += 40
+
+def remove_platform(data):
+    del data["platforms"][-1]
+
+def add_platforms(data):
+    first = data["platforms"][0]
+    data["platforms"].append(dict(first, x=first["x"] + 600, y=first["y"] - 150))
+    data["platforms"].append(dict(first))
+
+def retype_platform(data):
+    data["platforms"][0]["type"] = "ice"
+
+def move_goal_and_spawn(data):
+    data["goal"][0] -= 50
+    data["spawn"][0] += 20
+
+def move_keys(data):
+    for pair in data.get("key_doors", ()):
+        pair["key"][0] += 30
+        pair["door"][0] -= 30
+
+def rename(data):
+    data["name"] += " EDITED"
+    data["health"] += 1
+
+def widen_map(data):
+    data["map_width"] += 300
+
+def change_shadows(data):
+    data["shadow_countdown"] = [data["shadow_countdown"], 200]
+
+GOOD_EDITS = (
+    move_platform, remove_platform, add_platforms, retype_platform,
+    move_goal_and_spawn, move_keys, rename, widen_map, change_shadows,
+)
+
+# Saves that must be rejected, each changing level file text
+def unknown_type(text):
+    data = json.loads(text)
+    data["platforms"][2]["type"] = "lava"
+    return dumps(data)
+
+def misspelt_key(text):
+    data = json.loads(text)
+    data["key_doors"] = [{"kye": [100, 220], "door": [600, 420]}]
+    return dumps(data)
+
+def platform_in_key_doors(text):
+    data = json.loads(text)
+    data.setdefault("key_doors", []).append(dict(data["platforms"][0]))
+    return dumps(data)
+
+def missing_comma(text):
+    lines = text.splitlines()
+    at = next(i for i, line in enumerate(lines) if '"platforms"' in line) + 1
+    lines.insert(at, '    {"type": "normal", "width": 100, "height": 30, "x": 10, "y": 100}')
+    return "\n".join(lines)
+
+def truncated(text):
+    return text[:len(text) // 2]
+
+BAD_EDITS = (
+    unknown_type, misspelt_key, platform_in_key_doors, missing_comma, truncated,
+)
+
+class ScratchLevel:
+    """A level file the checks edit, and the running level it holds."""
+    def __init__(self, directory, text):
+        self.path = os.path.join(directory, "level.json")
+        self.mtime = 0
+        self.save(text)
+        self.level = Code.Level.from_file(self.path)
+        self.watcher = Code.LevelWatcher(self.level)
+
+    def save(self, text):
+        with open(self.path, "w") as f:
+            f.write(text)
+        # Saves closer together than the mtime resolution must be seen
+        self.mtime = max(self.mtime + 1, os.stat(self.path).st_mtime_ns)
+        os.utime(self.path, ns=(self.mtime, self.mtime))
+
+    def poll(self):
+        """Let the watcher apply the save; returns what it reported."""
+        self.watcher.next_poll = 0
+        report = io.StringIO()
+        with contextlib.redirect_stderr(report):
+            self.level = self.watcher.poll()
+        return report.getvalue().strip()
+
+def layout(level):
+    """Everything placed in the level, grid column by grid column."""
+    def columns(grid):
+        return [
+            sorted((type(sprite).__name__, *sprite.rect) for sprite in column)
+            for column in grid.columns
+        ]
+    return (
+        level.name, level.map_width, level.initial_health,
+        tuple(level.player.initial_pos),
+        [shadow.initial_countdown for shadow in level.shadows],
+        columns(level.background_sprites), columns(level.foreground_sprites),
+        columns(level.player.obstacles), len(level.all_sprites),
+    )
+
+def player_state(level):
+    player = level.player
+    return tuple(player.pos), tuple(player.vel), level.health
+
+def sync(fresh, level):
+    """Give fresh the player, health and picked up keys of level."""
+    player, played = fresh.player, level.player
+    player.pos.update(played.pos)
+    player.previous_pos.update(played.previous_pos)
+    player.vel.update(played.vel)
+    player.turning_left = played.turning_left
+    player.shoot_cd = played.shoot_cd
+    player.rect.midbottom = player.pos
+    fresh.health = level.health
+    for (played_key, _), (key, door) in zip(level.key_door_pairs, fresh.key_door_pairs):
+        if played_key.used:
+            key.on_picked_up()
+            door.on_unlocked()
+            player.obstacles.remove(door)
+
+def replays_alike(level, fresh):
+    """Whether both play REPLAYED ticks the same from now on."""
+    for played in (level, fresh):
+        played.history.clear()
+        played.all_bullets.clear()
+        for shadow in played.shadows:
+            shadow.reset()
+    for frame in range(REPLAYED):
+        inputs = running_input(frame + 7)
+        level.step(inputs)
+        fresh.step(inputs)
+        if (player_state(level), level.won) != (player_state(fresh), fresh.won):
+            return False
+    return True
+
+def check_edit(directory, text, edit):
+    """Problems with applying edit after some play, as a list of strings."""
+    scratch = ScratchLevel(directory, text)
+    old = scratch.level
+    for frame in range(PLAYED):
+        old.step(running_input(frame))
+    before = player_state(old)
+    data = json.loads(text)
+    edit(data)
+    scratch.save(dumps(data))
+    problems = []
+    report = scratch.poll()
+    if report:
+        problems.append(f"rejected: {report}")
+    level = scratch.level
+    if player_state(level) != before:
+        problems.append("player not kept")
+    fresh = Code.Level.from_file(scratch.path)
+    sync(fresh, level)
+    if layout(level) != layout(fresh):
+        problems.append("laid out unlike the saved file")
+    elif not replays_alike(level, fresh):
+        problems.append("plays unlike the saved file")
+    return problems
+
+def check_bad_save(directory, text, edit):
+    """Problems with rejecting a save edit breaks, as a list of strings."""
+    scratch = ScratchLevel(directory, text)
+    level = scratch.level
+    for frame in range(PLAYED):
+        level.step(running_input(frame))
+    before = layout(level), player_state(level)
+    scratch.save(edit(text))
+    problems = []
+    if not scratch.poll():
+        problems.append("not reported")
+    if scratch.level is not level or (layout(level), player_state(level)) != before:
+        problems.append("level changed")
+    # Saving a good file again applies it
+    data = json.loads(text)
+    move_platform(data)
+    scratch.save(dumps(data))
+    report = scratch.poll()
+    fresh = Code.Level.from_file(scratch.path)
+    sync(fresh, scratch.level)
+    if report or layout(scratch.level) != layout(fresh):
+        problems.append("the next good save was not applied")
+    return problems
+
+def time_synthetic(directory):
+    """ms to apply a one-platform edit of a SYNTHETIC_PLATFORMS level."""
+    data = {
+        "name": "SYNTHETIC", "map_width": SYNTHETIC_PLATFORMS * 120 + Code.WIDTH,
+        "spawn": [50, 450], "goal": [SYNTHETIC_PLATFORMS * 120, 480],
+        "shadow_countdown": 100, "health": 3,
+        "platforms": [
+            {"type": "normal", "width": 100, "height": 30, "x": i * 120, "y": 570}
+            for i in range(SYNTHETIC_PLATFORMS)
+        ],
+    }
+    scratch = ScratchLevel(directory, dumps(data))
+    times = []
+    for trial in range(5):
+        data["platforms"][SYNTHETIC_PLATFORMS // 2 + trial]["y"] -= 50
+        scratch.save(dumps(data))
+        start = time.perf_counter()
+        scratch.poll()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", "--filter", action="append", default=[],
+                        help="only check levels whose name contains this")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    pygame.display.set_mode((Code.WIDTH, Code.HEIGHT))
+    checked = failed = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for path in Code.LEVEL_FILES:
+            name = os.path.splitext(os.path.basename(path))[0]
+            if args.filter and not any(f in name for f in args.filter):
+                continue
+            with open(path) as f:
+                text = f.read()
+            for check, edits in ((check_edit, GOOD_EDITS), (check_bad_save, BAD_EDITS)):
+                for edit in edits:
+                    checked += 1
+                    problems = check(directory, text, edit)
+                    if problems:
+                        failed += 1
+                        print(f"FAIL {name} {edit.__name__}: {', '.join(problems)}")
+        if not args.filter:
+            print(f"one platform of {SYNTHETIC_PLATFORMS} moved in"
+                  f" {time_synthetic(directory):.1f}ms")
+    print(f"{checked - failed}/{checked} edits handled"
+          f" ({time.perf_counter() - start:.1f}s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
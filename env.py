@@ -0,0 +1,235 @@
+"""Gym-style environments for training and evaluating bots on levels.
+
+LevelEnv wraps one Level with reset()/step(). VectorEnv steps many of
+them in worker processes and returns batched NumPy arrays:
+
+    envs = VectorEnv(["levels/level_1.json"] * 256)
+    obs = envs.reset()
+    obs, rewards, dones, infos = envs.step(actions)
+
+Run this file to measure VectorEnv throughput on this machine.
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+import Code
+
+Code.muted = True
+
+# Actions are ints: horizontal move (none, left, right) x jump x shoot
+MOVES = ((False, False), (True, False), (False, True))
+ACTION_COUNT = len(MOVES) * 2 * 2
+
+MAX_SHADOWS = 2
+MAX_KEYS = 2
+MAX_BULLETS = 4
+OBSERVATION_SIZE = 9 + 4 * MAX_SHADOWS + 3 * MAX_KEYS + 2 * MAX_BULLETS + 1
+
+WIN_REWARD = 10.0
+DEATH_REWARD = -1.0
+
+def decode_action(action, level):
+    """InputState for an action; shots aim at the first shadow."""
+    action = int(action)
+    left, right = MOVES[action % 3]
+    shadow = level.shadow.rect
+    return Code.InputState(
+        left, right,
+        bool(action // 3 % 2),
+        bool(action // 6),
+        (shadow.centerx - level.camera_x_offset, shadow.centery),
+    )
+
+class LevelEnv:
+    """One level as an environment.
+
+    source is a level file path, or a picklable callable returning a
+    Level. Rewards are progress toward the goal as a fraction of the map
+    width, DEATH_REWARD per life lost and WIN_REWARD for reaching the
+    goal. An episode ends when the level is won or lost, or after
+    max_steps steps.
+    """
+    def __init__(self, source, max_steps=10_000, frame_skip=1):
+        self.source = source
+        if isinstance(source, str):
+            self.level = Code.Level.from_file(source)
+        else:
+            self.level = source()
+        self.max_steps = max_steps
+        self.frame_skip = frame_skip
+        self.steps = 0
+
+    def reset(self):
+        self.level.hard_reset()
+        self.steps = 0
+        self.distance = self._goal_distance()
+        return self.observe()
+
+    def _goal_distance(self):
+        return abs(self.level.goal.rect.centerx - self.level.player.pos.x)
+
+    def step(self, action):
+        level = self.level
+        inputs = decode_action(action, level)
+        health = level.health
+        for _ in range(self.frame_skip):
+            level.step(inputs)
+            if level.finished:
+                break
+        self.steps += 1
+
+        distance = self._goal_distance()
+        reward = (self.distance - distance) / level.map_width
+        self.distance = distance
+        reward += DEATH_REWARD * (health - level.health)
+        if level.won:
+            reward += WIN_REWARD
+        truncated = self.steps >= self.max_steps
+        done = level.finished or truncated
+        info = {"won": level.won, "truncated": truncated and not level.finished}
+        return self.observe(), reward, done, info
+
+    def observe(self):
+        level = self.level
+        player = level.player
+        obs = np.zeros(OBSERVATION_SIZE, np.float32)
+        px, py = player.pos
+        goal = level.goal.rect
+        obs[:9] = (
+            px, py, *player.vel, player.shoot_cd,
+            goal.centerx - px, goal.bottom - py,
+            level.health, px / level.map_width,
+        )
+        i = 9
+        for shadow in level.shadows[:MAX_SHADOWS]:
+            obs[i:i + 4] = (
+                shadow.rect.centerx - px, shadow.rect.bottom - py,
+                shadow.countdown, 1.0,
+            )
+            i += 4
+        i = 9 + 4 * MAX_SHADOWS
+        for key, _ in level.key_door_pairs[:MAX_KEYS]:
+            obs[i:i + 3] = (
+                key.rect.centerx - px, key.rect.centery - py, key.used
+            )
+            i += 3
+        i = 9 + 4 * MAX_SHADOWS + 3 * MAX_KEYS
+        bullets = level.all_bullets
+        count = min(len(bullets), MAX_BULLETS)
+        if count:
+            # The most recently fired bullets
+            relative = bullets.pos[len(bullets) - count:len(bullets)] - (px, py)
+            obs[i:i + 2 * count] = relative.ravel()
+        obs[-1] = len(bullets)
+        return obs
+
+def _worker(connection, sources, env_kwargs):
+    envs = [LevelEnv(source, **env_kwargs) for source in sources]
+    while True:
+        command, data = connection.recv()
+        if command == "step":
+            results = []
+            for env, action in zip(envs, data):
+                obs, reward, done, info = env.step(action)
+                if done:
+                    info["final_observation"] = obs
+                    obs = env.reset()
+                results.append((obs, reward, done, info))
+            connection.send(results)
+        elif command == "reset":
+            connection.send([env.reset() for env in envs])
+        elif command == "close":
+            connection.close()
+            return
+
+class VectorEnv:
+    """Many LevelEnvs stepped in parallel across worker processes.
+
+    Environments that finish are reset automatically; the last
+    observation of the finished episode is in info["final_observation"].
+    """
+    def __init__(self, sources, workers=None, **env_kwargs):
+        self.num_envs = len(sources)
+        workers = min(workers or os.cpu_count() or 1, self.num_envs)
+        bounds = np.linspace(0, self.num_envs, workers + 1).astype(int)
+        self.slices = [
+            slice(start, stop) for start, stop in zip(bounds, bounds[1:])
+        ]
+        self.connections = []
+        self.processes = []
+        for part in self.slices:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, args=(child, sources[part], env_kwargs),
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def reset(self):
+        for connection in self.connections:
+            connection.send(("reset", None))
+        return np.stack([
+            obs for connection in self.connections for obs in connection.recv()
+        ])
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        for connection, part in zip(self.connections, self.slices):
+            connection.send(("step", actions[part].tolist()))
+        results = [
+            result for connection in self.connections
+            for result in connection.recv()
+        ]
+        obs, rewards, dones, infos = zip(*results)
+        return (
+            np.stack(obs),
+            np.array(rewards, np.float32),
+            np.array(dones, bool),
+            list(infos),
+        )
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("close", None))
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure VectorEnv throughput.")
+    parser.add_argument("--envs", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    levels = list(Code.LEVEL_FILES) * (args.envs // len(Code.LEVEL_FILES) + 1)
+    with VectorEnv(levels[:args.envs], workers=args.workers) as envs:
+        envs.reset()
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            envs.step(rng.integers(ACTION_COUNT, size=envs.num_envs))
+            steps += envs.num_envs
+        elapsed = time.perf_counter() - start
+    print(f"{envs.num_envs} envs, {len(envs.processes)} workers:"
+          f" {steps / elapsed:,.0f} steps/s")
+
+if __name__ == "__main__":
+    main()
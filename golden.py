@@ -0,0 +1,184 @@
+"""Golden-image checks for level rendering.
+
+Renders scripted moments of every bundled level offscreen and compares
+them with the images stored in golden/. Each moment is drawn straight to
+a surface, through a PlatformBand, through a DrawList and with SDL's
+software renderer (see RendererScreen), and all of them must match the
+same image. A pixel differs when any channel is off by
+more than --tolerance; for a failing image a heatmap of the differences
+is written next to the report.
+
+    python golden.py                     # check, exits 1 on differences
+    python golden.py --update            # re-render the golden images
+    python golden.py -k level_4          # only moments matching this
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import Code
+
+Code.muted = True
+
+GOLDEN_DIR = "golden"
+FAILURE_DIR = "golden_failures"
+TOLERANCE = 2  # per channel
+MAX_DIFFERING = 0  # pixels over the tolerance before an image fails
+
+def running_input(frame):
+    """Run right, jumping and shooting now and then.
+
+    The same script as bench.scripted_input, kept here so tuning the
+    benchmarks never changes which frames are checked.
+    """
+    return Code.InputState(
+        right=True,
+        jump=frame % 90 < 10,
+        shoot=frame % 45 == 0,
+        aim=(600, 300),
+    )
+
+def teleport(level, x, y):
+    """Put the player at (x, y) and let one idle step settle the level."""
+    player = level.player
+    player.pos.update(x, y)
+    player.rect.midbottom = player.pos
+    level.step()
+
+def at_spawn(level):
+    level.step()
+
+def running(level):
+    for frame in range(104):
+        level.step(running_input(frame))
+
+def mid_level(level):
+    teleport(level, level.map_width // 2, level.player.pos.y)
+
+def door_locked(level):
+    _, door = level.key_door_pairs[0]
+    teleport(level, door.rect.left - 200, door.rect.top)
+
+def door_unlocked(level):
+    key, door = level.key_door_pairs[0]
+    teleport(level, *key.rect.midbottom)
+    teleport(level, door.rect.left - 200, door.rect.top)
+
+MOMENTS = (at_spawn, running, mid_level)
+KEY_MOMENTS = (door_locked, door_unlocked)
+
+def scripted_frames():
+    """(name, function(level)) for every level and moment."""
+    for path in Code.LEVEL_FILES:
+        name = os.path.splitext(os.path.basename(path))[0]
+        level = Code.Level.from_file(path)
+        moments = MOMENTS + (KEY_MOMENTS if level.key_door_pairs else ())
+        for moment in moments:
+            def setup(moment=moment, path=path):
+                level = Code.Level.from_file(path)
+                moment(level)
+                return level
+            yield f"{name}_{moment.__name__}", setup
+
+renderer_screen = None
+
+def render(level, background, variant):
+    global renderer_screen
+    surface = Code.display_format(pygame.Surface((Code.WIDTH, Code.HEIGHT)))
+    if variant == "renderer":
+        if renderer_screen is None:
+            renderer_screen = Code.RendererScreen("golden", software=True)
+        renderer_screen.blit(background.image, background.rect)
+        level.render(renderer_screen)
+        return renderer_screen.renderer.to_surface(surface)
+    surface.blit(background.image, background.rect)
+    if variant == "band":
+        level.platform_band = Code.PlatformBand(level.background_sprites)
+        level.render(surface)
+        level.platform_band = None
+    elif variant == "draw_list":
+        draw_list = Code.DrawList(surface.get_size())
+        level.render(draw_list)
+        surface.blits(draw_list.commands, False)
+    else:
+        level.render(surface)
+    return surface
+
+VARIANTS = ("surface", "band", "draw_list", "renderer")
+
+def compare(actual, expected, tolerance):
+    """Number of pixels differing by more than tolerance, and the heatmap."""
+    if actual.shape != expected.shape:
+        return actual.shape[0] * actual.shape[1], None
+    difference = np.abs(actual.astype(np.int16) - expected).max(axis=2)
+    differing = difference > tolerance
+    count = int(np.count_nonzero(differing))
+    if not count:
+        return 0, None
+    # Dimmed expected image, differing pixels in red by how far off
+    heatmap = expected // 4
+    heatmap[differing] = 0
+    heatmap[differing, 0] = 64 + difference[differing] * 191 // 255
+    return count, heatmap
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update", action="store_true",
+                        help="write the rendered frames as the new golden images")
+    parser.add_argument("-k", "--filter", action="append", default=[],
+                        help="only check frames whose name contains this")
+    parser.add_argument("--tolerance", type=int, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    pygame.display.set_mode((Code.WIDTH, Code.HEIGHT))
+    Code.ImageHorizontalTile.convert_strips()
+    Code.TextureAtlas.build()
+    background = Code.Images("images/GameScreen.png", 0, 0, Code.WIDTH, Code.HEIGHT)
+    if args.update:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+
+    checked = failed = 0
+    for name, setup in scripted_frames():
+        if args.filter and not any(f in name for f in args.filter):
+            continue
+        golden_path = os.path.join(GOLDEN_DIR, name + ".png")
+        level = setup()
+        if args.update:
+            pygame.image.save(render(level, background, "surface"), golden_path)
+            print(f"wrote {golden_path}")
+            continue
+        if not os.path.exists(golden_path):
+            print(f"FAIL {name}: no golden image, run with --update")
+            failed += 1
+            continue
+        expected = pygame.surfarray.array3d(pygame.image.load(golden_path))
+        for variant in VARIANTS:
+            checked += 1
+            actual = pygame.surfarray.array3d(render(level, background, variant))
+            count, heatmap = compare(actual, expected, args.tolerance)
+            if count <= MAX_DIFFERING:
+                continue
+            failed += 1
+            detail = f"{count} pixels differ"
+            if heatmap is not None:
+                os.makedirs(FAILURE_DIR, exist_ok=True)
+                diff_path = os.path.join(FAILURE_DIR, f"{name}_{variant}.png")
+                pygame.image.save(pygame.surfarray.make_surface(heatmap), diff_path)
+                detail += f", heatmap in {diff_path}"
+            print(f"FAIL {name} ({variant}): {detail}")
+    if not args.update:
+        print(f"{checked - failed}/{checked} frames match"
+              f" ({time.perf_counter() - start:.1f}s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
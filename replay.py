@@ -0,0 +1,202 @@
+"""Input recording and deterministic headless replay.
+
+A recording holds one segment per level run: the level file, the
+run-length encoded input of every frame and the state the level ended
+in. Replaying re-runs each segment through Level.step as fast as the CPU
+allows and checks that it ends in the same state.
+
+    python replay.py record session.ncr   # play normally, recording input
+    python replay.py play session.ncr     # replay headlessly and verify
+"""
+import os
+import struct
+import sys
+import time
+from typing import NamedTuple
+
+if sys.argv[1:2] == ["play"]:
+    # Replaying never opens a window or plays sound
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import Code
+
+MAGIC = b"NCRP"
+VERSION = 1
+
+LEFT, RIGHT, JUMP, SHOOT = 1, 2, 4, 8
+MAX_RUN = 0xFFFF
+
+RUN = struct.Struct("<HB")
+AIM = struct.Struct("<hh")
+SEGMENT_HEADER = struct.Struct("<HI")
+FINAL_STATE = struct.Struct("<ddddhBI")
+
+class FinalState(NamedTuple):
+    x: float
+    y: float
+    vel_x: float
+    vel_y: float
+    health: int
+    won: bool
+    frames: int
+
+    @classmethod
+    def of(cls, level, frames):
+        player = level.player
+        return cls(*player.pos, *player.vel, level.health, level.won, frames)
+
+class Segment(NamedTuple):
+    level_path: str
+    runs: list  # [count, InputState] pairs
+    final_state: FinalState
+
+def _flags(inputs):
+    return (
+        LEFT * bool(inputs.left) | RIGHT * bool(inputs.right)
+        | JUMP * bool(inputs.jump) | SHOOT * bool(inputs.shoot)
+    )
+
+def normalize(inputs):
+    """Drop the aim point when not shooting; it is only read when firing.
+
+    This is what lets mouse movement between shots compress away.
+    """
+    return Code.InputState(
+        bool(inputs.left), bool(inputs.right),
+        bool(inputs.jump), bool(inputs.shoot),
+        tuple(inputs.aim) if inputs.shoot else (0, 0),
+    )
+
+class InputRecorder:
+    """Collects the input of each level run, for Game(recorder=...)."""
+    def __init__(self):
+        self.segments = []
+        self.level = None
+
+    def start_level(self, level):
+        if level.path is None:
+            raise ValueError("only levels loaded from a file can be recorded")
+        if self.level is not None:
+            self.finish_level(self.level)
+        self.level = level
+        self.runs = []
+        self.frames = 0
+
+    def record(self, inputs):
+        inputs = normalize(inputs)
+        self.frames += 1
+        if self.runs and self.runs[-1][1] == inputs:
+            self.runs[-1][0] += 1
+        else:
+            self.runs.append([1, inputs])
+
+    def finish_level(self, level):
+        self.segments.append(Segment(
+            level.path, self.runs, FinalState.of(level, self.frames)
+        ))
+        self.level = None
+
+    def close(self):
+        if self.level is not None:
+            self.finish_level(self.level)
+
+    def save(self, path):
+        self.close()
+        with open(path, "wb") as f:
+            f.write(encode(self.segments))
+
+def encode(segments) -> bytes:
+    out = [MAGIC, bytes((VERSION,))]
+    for segment in segments:
+        path = segment.level_path.encode()
+        runs = []
+        for count, inputs in segment.runs:
+            flags = _flags(inputs)
+            while count:
+                chunk = min(count, MAX_RUN)
+                run = RUN.pack(chunk, flags)
+                if flags & SHOOT:
+                    run += AIM.pack(*inputs.aim)
+                runs.append(run)
+                count -= chunk
+        out.append(SEGMENT_HEADER.pack(len(path), len(runs)))
+        out.append(path)
+        out.extend(runs)
+        out.append(FINAL_STATE.pack(*segment.final_state))
+    return b"".join(out)
+
+def decode(data: bytes):
+    if data[:4] != MAGIC or data[4] != VERSION:
+        raise ValueError("not a recording, or an unsupported version")
+    segments = []
+    offset = 5
+    while offset < len(data):
+        path_length, run_count = SEGMENT_HEADER.unpack_from(data, offset)
+        offset += SEGMENT_HEADER.size
+        path = data[offset:offset + path_length].decode()
+        offset += path_length
+        runs = []
+        for _ in range(run_count):
+            count, flags = RUN.unpack_from(data, offset)
+            offset += RUN.size
+            aim = (0, 0)
+            if flags & SHOOT:
+                aim = AIM.unpack_from(data, offset)
+                offset += AIM.size
+            runs.append([count, Code.InputState(
+                bool(flags & LEFT), bool(flags & RIGHT),
+                bool(flags & JUMP), bool(flags & SHOOT), aim,
+            )])
+        final_state = FinalState(*FINAL_STATE.unpack_from(data, offset))
+        offset += FINAL_STATE.size
+        segments.append(Segment(path, runs, final_state))
+    return segments
+
+def replay_segment(segment: Segment):
+    """Re-run one level run headlessly and return the state it ends in."""
+    level = Code.Level.from_file(segment.level_path)
+    frames = 0
+    for count, inputs in segment.runs:
+        for _ in range(count):
+            level.step(inputs)
+        frames += count
+    return FinalState.of(level, frames)
+
+def replay(path):
+    """Replay every segment of a recording; returns (segment, result) pairs."""
+    with open(path, "rb") as f:
+        segments = decode(f.read())
+    return [(segment, replay_segment(segment)) for segment in segments]
+
+def main(argv):
+    if len(argv) != 3 or argv[1] not in ("record", "play"):
+        print(__doc__)
+        return 2
+    if argv[1] == "record":
+        recorder = InputRecorder()
+        try:
+            Code.Game(Code.LEVEL_FILES, recorder=recorder).main()
+        finally:
+            recorder.save(argv[2])
+        return 0
+
+    Code.muted = True
+    start = time.perf_counter()
+    results = replay(argv[2])
+    elapsed = time.perf_counter() - start
+    failed = 0
+    for segment, result in results:
+        ok = result == segment.final_state
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {segment.level_path}"
+              f" {result.frames} frames")
+        if not ok:
+            print(f"     expected {segment.final_state}")
+            print(f"     got      {result}")
+    frames = sum(result.frames for _, result in results)
+    print(f"replayed {frames} frames in {elapsed * 1000:.1f}ms")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
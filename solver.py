@@ -0,0 +1,318 @@
+"""Check that levels can be won, by searching over the real player physics.
+
+The search holds one of a few inputs for MACRO_FRAMES frames at a time
+and steps Player.physics exactly like Level.step does, picking up keys
+(which opens their doors) and rejecting states where the player falls
+into the void or is caught by a shadow. Without shots a shadow is the
+player's own path, countdown - 1 frames late, so it is checked against
+the trail that led to each state. States are deduplicated on quantized
+position, velocity and keys held, and expanded best-first toward the
+goal.
+
+A route found is replayed through Level.step to verify it and can be
+saved as a recording for `python replay.py play`. "No route" means the
+whole discretized space was exhausted without shooting, which is a
+strong hint but not a proof for finer inputs.
+
+    python solver.py                     # every bundled level, in parallel
+    python solver.py levels/level_4.json --save routes/
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import heapq
+import multiprocessing
+import sys
+import time
+from typing import NamedTuple
+
+import Code
+import replay
+
+Code.muted = True
+
+MACRO_FRAMES = 6
+ACTIONS = tuple(
+    Code.InputState(left, right, jump)
+    for left, right in ((False, False), (True, False), (False, True))
+    for jump in (False, True)
+)
+POSITION_STEP = 8  # pixels
+VELOCITY_STEP = 2.0  # pixels/frame
+MAX_FRAMES = Code.TICK_RATE * 180
+MAX_STATES = 2_000_000
+
+class Node:
+    """A search state; positions are the player's after each macro frame."""
+    __slots__ = ("parent", "action", "frame", "pos", "vel", "keys",
+                 "positions")
+
+    def __init__(self, parent, action, frame, pos, vel, keys, positions):
+        self.parent = parent
+        self.action = action
+        self.frame = frame
+        self.pos = pos
+        self.vel = vel
+        self.keys = keys
+        self.positions = positions
+
+    def trail(self, first, last):
+        """Player positions after frames first..last (1-based) on this path."""
+        first, last = max(first, 1), min(last, self.frame)
+        chunks = []
+        node = self
+        while node is not None and last >= first:
+            start = node.frame - len(node.positions) + 1
+            if start <= last:
+                chunks.append(
+                    node.positions[max(first, start) - start:last - start + 1]
+                )
+                last = start - 1
+            node = node.parent
+        return [pos for chunk in reversed(chunks) for pos in chunk]
+
+    def actions(self):
+        node, actions = self, []
+        while node.parent is not None:
+            actions.append(node.action)
+            node = node.parent
+        actions.reverse()
+        return actions
+
+class Result(NamedTuple):
+    path: str
+    runs: list  # [count, InputState] pairs, empty without a route
+    states: int
+    exhausted: bool
+    verified: bool
+    seconds: float
+
+class Solver:
+    def __init__(self, level):
+        self.level = level
+        self.player = level.player
+        self.keys = 0  # bit i set when key i is picked up
+        self.shadow_rect = self.player.rect.copy()
+        self.delays = [shadow.initial_countdown - 1 for shadow in level.shadows]
+
+    def set_keys(self, keys):
+        """Put back the doors of the keys not held, remove the others."""
+        obstacles = self.player.obstacles
+        for i, (_, door) in enumerate(self.level.key_door_pairs):
+            held, was_held = keys >> i & 1, self.keys >> i & 1
+            if held and not was_held:
+                obstacles.remove(door)
+            elif was_held and not held:
+                obstacles.append(door)
+        self.keys = keys
+
+    def restore(self, node):
+        player = self.player
+        player.pos.update(node.pos)
+        player.vel.update(node.vel)
+        player.rect.midbottom = player.pos
+        self.set_keys(node.keys)
+        if self.level.streamer is not None:
+            self.level.streamer.update(self.level.camera_for(player.pos.x))
+
+    def shadow_trails(self, node):
+        """(delay, first frame, positions) the shadows replay from node on."""
+        trails = []
+        for delay in self.delays:
+            first = max(1, node.frame + 1 - delay)
+            trails.append(
+                (delay, first, node.trail(first, first + MACRO_FRAMES - 1))
+            )
+        return trails
+
+    def caught(self, node, frame, positions, trails):
+        """Whether a shadow is on the player after frame."""
+        player_rect = self.player.rect
+        shadow_rect = self.shadow_rect
+        for delay, first, trail in trails:
+            source = frame - delay
+            if source < 1:
+                continue
+            if source > node.frame:
+                shadow_rect.midbottom = positions[source - node.frame - 1]
+            else:
+                shadow_rect.midbottom = trail[source - first]
+            if player_rect.colliderect(shadow_rect):
+                return True
+        return False
+
+    def expand(self, node, action, trails):
+        """Hold action from node; returns (child, won), child None if dead."""
+        self.restore(node)
+        level, player = self.level, self.player
+        keys = node.keys
+        positions = []
+        for frame in range(node.frame + 1, node.frame + MACRO_FRAMES + 1):
+            player.physics(action)
+            if level.streamer is not None:
+                level.streamer.update(level.camera_for(player.pos.x))
+            positions.append(tuple(player.pos))
+            for i, (key, _) in enumerate(level.key_door_pairs):
+                if not keys >> i & 1 and player.rect.colliderect(key.rect):
+                    keys |= 1 << i
+                    self.set_keys(keys)
+            if player.is_in_void() or self.caught(node, frame, positions, trails):
+                return None, False
+            if player.rect.colliderect(level.goal.rect):
+                break
+        child = Node(node, action, node.frame + len(positions),
+                     tuple(player.pos), tuple(player.vel), keys, positions)
+        return child, player.rect.colliderect(level.goal.rect)
+
+    def search(self, max_frames=MAX_FRAMES, max_states=MAX_STATES):
+        """Best-first search; returns (winning node or None, states, exhausted)."""
+        level = self.level
+        level.hard_reset()
+        self.set_keys(0)
+        player = self.player
+        root = Node(None, None, 0, tuple(player.pos), tuple(player.vel), 0, [])
+        seen = {self.state_key(root)}
+        queue = [(0, 0, 0, root)]
+        counter = 1
+        while queue:
+            _, _, _, node = heapq.heappop(queue)
+            if node.frame >= max_frames:
+                continue
+            trails = self.shadow_trails(node)
+            for action in ACTIONS:
+                child, won = self.expand(node, action, trails)
+                if won:
+                    return child, len(seen), False
+                if child is None:
+                    continue
+                state_key = self.state_key(child)
+                if state_key in seen:
+                    continue
+                seen.add(state_key)
+                if len(seen) >= max_states:
+                    return None, len(seen), False
+                # Closest to the goal first, earliest first among equals
+                heapq.heappush(
+                    queue, (self.distance(child), child.frame, counter, child)
+                )
+                counter += 1
+        return None, len(seen), True
+
+    def distance(self, node):
+        """Rough path length to the goal, via the keys not held yet.
+
+        Keys are visited nearest first; this only orders the search.
+        """
+        (x, y), keys = node.pos, node.keys
+        targets = [
+            key.rect.midbottom
+            for i, (key, _) in enumerate(self.level.key_door_pairs)
+            if not keys >> i & 1
+        ]
+        distance = 0
+        while targets:
+            target = min(targets, key=lambda t: abs(t[0] - x) + abs(t[1] - y))
+            targets.remove(target)
+            distance += abs(target[0] - x) + abs(target[1] - y)
+            x, y = target
+        goal_x, goal_y = self.level.goal.rect.midbottom
+        distance += abs(goal_x - x) + abs(goal_y - y)
+        return int(distance) // POSITION_STEP
+
+    @staticmethod
+    def state_key(node):
+        x, y = node.pos
+        vx, vy = node.vel
+        return (
+            round(x / POSITION_STEP), round(y / POSITION_STEP),
+            round(vx / VELOCITY_STEP), round(vy / VELOCITY_STEP),
+            node.keys,
+        )
+
+def to_runs(actions):
+    runs = []
+    for action in actions:
+        if runs and runs[-1][1] == action:
+            runs[-1][0] += MACRO_FRAMES
+        else:
+            runs.append([MACRO_FRAMES, action])
+    return runs
+
+def verify(path, runs):
+    """Replay runs through Level.step; True if the level is won unharmed."""
+    level = Code.Level.from_file(path)
+    for count, inputs in runs:
+        for _ in range(count):
+            level.step(inputs)
+            if level.won:
+                return level.health == level.initial_health
+    return False
+
+def solve(path, max_frames=MAX_FRAMES, max_states=MAX_STATES):
+    start = time.perf_counter()
+    solver = Solver(Code.Level.from_file(path))
+    node, states, exhausted = solver.search(max_frames, max_states)
+    runs = to_runs(node.actions()) if node is not None else []
+    verified = bool(runs) and verify(path, runs)
+    return Result(path, runs, states, exhausted, verified,
+                  time.perf_counter() - start)
+
+def _solve(args):
+    return solve(*args)
+
+def save_route(result, directory):
+    """Write a route as a recording that replay.py can play back."""
+    segment = replay.Segment(result.path, result.runs, None)
+    final_state = replay.replay_segment(segment)
+    name = os.path.splitext(os.path.basename(result.path))[0]
+    destination = os.path.join(directory, name + ".ncr")
+    with open(destination, "wb") as f:
+        f.write(replay.encode([segment._replace(final_state=final_state)]))
+    return destination
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that levels can be won.")
+    parser.add_argument("levels", nargs="*", default=list(Code.LEVEL_FILES))
+    parser.add_argument("--save", metavar="DIR",
+                        help="write each route found as a replay recording")
+    parser.add_argument("--max-frames", type=int, default=MAX_FRAMES)
+    parser.add_argument("--max-states", type=int, default=MAX_STATES)
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    work = [(path, args.max_frames, args.max_states) for path in args.levels]
+    # Not `with Pool`: SDL turns the SIGTERM of Pool.terminate into a
+    # quit event, so workers have to be let go with close() instead
+    pool = multiprocessing.Pool(args.jobs)
+    try:
+        results = pool.map(_solve, work)
+    finally:
+        pool.close()
+        pool.join()
+
+    failed = 0
+    for result in results:
+        if result.runs:
+            frames = sum(count for count, _ in result.runs)
+            status = "ok  " if result.verified else "FAIL"
+            detail = f"route of {frames} frames"
+            if not result.verified:
+                detail += " did not replay to a win"
+        else:
+            status = "FAIL"
+            detail = ("no route" if result.exhausted
+                      else "gave up before exhausting the search")
+        failed += status == "FAIL"
+        print(f"{status} {result.path}: {detail}"
+              f" ({result.states} states, {result.seconds:.1f}s)")
+        if args.save and result.verified:
+            os.makedirs(args.save, exist_ok=True)
+            print(f"     saved {save_route(result, args.save)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
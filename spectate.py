@@ -0,0 +1,446 @@
+"""Live state broadcast of a running game, for spectators and overlays.
+
+StatePublisher serves every Level tick over a local socket. Each frame
+is a length-prefixed message: a keyframe holds the whole state, a delta
+only the fields that changed since the previous frame, as zigzag
+varints. Every KEYFRAME_INTERVAL broadcasts everyone gets a keyframe.
+
+The game thread only snapshots the level and hands it to an asyncio
+loop on a thread of its own, so publishing never waits on the network.
+Ticks published while the loop is busy are coalesced into the newest
+one, and a subscriber whose socket is backed up skips frames and is
+sent a keyframe once it catches up.
+
+    python spectate.py serve                 # play, publishing on ADDRESS
+    python spectate.py watch                 # follow a published game
+    python spectate.py bench --subscribers 500
+"""
+import os
+import sys
+
+if sys.argv[1:2] == ["bench"]:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import asyncio
+import multiprocessing
+import struct
+import threading
+import time
+from typing import NamedTuple
+
+import Code
+
+ADDRESS = "127.0.0.1:7777"  # host:port, or a path for a Unix socket
+KEYFRAME_INTERVAL = 60
+MAX_BUFFER = 64 * 1024  # bytes queued for a subscriber before frames drop
+FIXED = 256  # player position and velocity are sent in 1/FIXED pixels
+
+KEYFRAME, DELTA = 1, 2
+
+LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<BI")  # kind, tick
+COUNT = struct.Struct("<H")
+
+class State(NamedTuple):
+    tick: int
+    level: str
+    # health, keys picked up, doors unlocked (one bit per pair), player
+    # x, y, vel x, vel y, then the midbottom of each shadow
+    values: tuple
+    bullets: bytes  # int32 x, y pairs
+
+    @classmethod
+    def of(cls, level, tick):
+        player = level.player
+        values = [
+            level.health,
+            sum(key.used << i for i, (key, _) in enumerate(level.key_door_pairs)),
+            sum(door.unlocked << i
+                for i, (_, door) in enumerate(level.key_door_pairs)),
+            round(player.pos.x * FIXED), round(player.pos.y * FIXED),
+            round(player.vel.x * FIXED), round(player.vel.y * FIXED),
+        ]
+        for shadow in level.shadows:
+            values.extend(shadow.rect.midbottom)
+        bullets = level.all_bullets
+        return cls(
+            tick, level.name, tuple(values),
+            bullets.pos[:len(bullets)].astype("<i4").tobytes(),
+        )
+
+    @property
+    def player_pos(self):
+        return self.values[3] / FIXED, self.values[4] / FIXED
+
+def _write_varint(value, out):
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    return (value >> 1 if not value & 1 else -(value >> 1) - 1), offset
+
+def _bullets(bullets):
+    return COUNT.pack(len(bullets) // 8) + bullets
+
+def encode_keyframe(state):
+    name = state.level.encode()
+    body = b"".join((
+        HEADER.pack(KEYFRAME, state.tick),
+        bytes((len(name),)), name,
+        bytes((len(state.values),)),
+        struct.pack(f"<{len(state.values)}i", *state.values),
+        _bullets(state.bullets),
+    ))
+    return LENGTH.pack(len(body)) + body
+
+def encode_delta(previous, state):
+    """Fields of state that differ from previous; None if a keyframe is needed."""
+    if previous.level != state.level or len(previous.values) != len(state.values):
+        return None
+    # One bit per value, and a last one for the bullets
+    mask = bytearray((len(state.values) + 8) // 8)
+    changes = bytearray()
+    for i, (old, new) in enumerate(zip(previous.values, state.values)):
+        if old != new:
+            mask[i // 8] |= 1 << i % 8
+            _write_varint(new - old, changes)
+    bullets = len(state.values)
+    if previous.bullets != state.bullets:
+        mask[bullets // 8] |= 1 << bullets % 8
+        changes += _bullets(state.bullets)
+    body = HEADER.pack(DELTA, state.tick) + mask + changes
+    return LENGTH.pack(len(body)) + body
+
+class StateDecoder:
+    """Rebuilds States from frames; deltas before the first keyframe are skipped."""
+    def __init__(self):
+        self.state = None
+
+    def feed(self, body):
+        """Apply one frame (without its length prefix); returns the State or None."""
+        kind, tick = HEADER.unpack_from(body)
+        offset = HEADER.size
+        if kind == KEYFRAME:
+            name_length = body[offset]
+            offset += 1
+            level = body[offset:offset + name_length].decode()
+            offset += name_length
+            count = body[offset]
+            offset += 1
+            values = struct.unpack_from(f"<{count}i", body, offset)
+            offset += 4 * count
+            self.state = State(tick, level, values, self._read_bullets(body, offset))
+        elif self.state is not None:
+            previous = self.state
+            count = len(previous.values)
+            mask = body[offset:offset + (count + 8) // 8]
+            offset += len(mask)
+            values = list(previous.values)
+            for i in range(count):
+                if mask[i // 8] >> i % 8 & 1:
+                    difference, offset = _read_varint(body, offset)
+                    values[i] += difference
+            bullets = previous.bullets
+            if mask[count // 8] >> count % 8 & 1:
+                bullets = self._read_bullets(body, offset)
+            self.state = State(tick, previous.level, tuple(values), bullets)
+        else:
+            return None
+        return self.state
+
+    @staticmethod
+    def _read_bullets(body, offset):
+        (count,) = COUNT.unpack_from(body, offset)
+        offset += COUNT.size
+        return bytes(body[offset:offset + 8 * count])
+
+class Subscriber:
+    def __init__(self, writer):
+        self.writer = writer
+        self.needs_keyframe = True
+        self.frames = 0
+        self.dropped = 0
+
+async def _start_server(handler, address):
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return await asyncio.start_server(handler, host, int(port))
+    return await asyncio.start_unix_server(handler, address)
+
+async def _open_connection(address):
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+
+class StatePublisher:
+    """Serves each published tick to every subscriber, see the module doc.
+
+    publish() is called from the game loop, for Game(publisher=...).
+    """
+    def __init__(self, address=ADDRESS, keyframe_interval=KEYFRAME_INTERVAL,
+                 max_buffer=MAX_BUFFER):
+        self.address = address
+        self.keyframe_interval = keyframe_interval
+        self.max_buffer = max_buffer
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.pending = None
+        self.previous = None
+        self.ticks = 0
+        self.broadcasts = 0
+        self.coalesced = 0
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        """Start serving on a background thread once the socket is bound."""
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait()
+        if self.loop is None:
+            raise OSError(f"could not serve on {self.address}")
+        return self
+
+    def _run(self, ready):
+        asyncio.run(self._serve(ready))
+
+    async def _serve(self, ready):
+        try:
+            server = await _start_server(self._subscribe, self.address)
+        except OSError:
+            ready.set()
+            raise
+        self.stopped = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        ready.set()
+        async with server:
+            await self.stopped.wait()
+        for subscriber in self.subscribers:
+            # Not close(): that waits for the buffer to go out
+            subscriber.writer.transport.abort()
+        while self.subscribers:
+            await asyncio.sleep(0)
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join()
+            self.loop = None
+
+    async def _subscribe(self, reader, writer):
+        subscriber = Subscriber(writer)
+        self.subscribers.append(subscriber)
+        try:
+            # Subscribers only listen; wait for them to hang up
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.remove(subscriber)
+            writer.close()
+
+    def publish(self, level):
+        """Snapshot level for the subscribers; never blocks on them."""
+        state = State.of(level, self.ticks)
+        self.ticks += 1
+        with self.lock:
+            waiting, self.pending = self.pending, state
+        if waiting is None:
+            self.loop.call_soon_threadsafe(self._broadcast)
+        else:
+            self.coalesced += 1
+
+    def _broadcast(self):
+        with self.lock:
+            state, self.pending = self.pending, None
+        keyframe = None
+        delta = None
+        if self.previous is not None and self.broadcasts % self.keyframe_interval:
+            delta = encode_delta(self.previous, state)
+        self.previous = state
+        self.broadcasts += 1
+        for subscriber in self.subscribers:
+            transport = subscriber.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                # Too far behind: it will need a keyframe to pick up again
+                subscriber.dropped += 1
+                subscriber.needs_keyframe = True
+                continue
+            if subscriber.needs_keyframe or delta is None:
+                if keyframe is None:
+                    keyframe = encode_keyframe(state)
+                subscriber.writer.write(keyframe)
+                subscriber.needs_keyframe = False
+            else:
+                subscriber.writer.write(delta)
+            subscriber.frames += 1
+
+async def read_frames(reader):
+    """Yield the body of each frame until the publisher hangs up."""
+    while True:
+        try:
+            prefix = await reader.readexactly(LENGTH.size)
+            (length,) = LENGTH.unpack(prefix)
+            yield await reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+async def watch(address):
+    """Stand-in spectator: print the state about once a second."""
+    reader, writer = await _open_connection(address)
+    decoder = StateDecoder()
+    frames = received = 0
+    last_report = time.perf_counter()
+    async for body in read_frames(reader):
+        frames += 1
+        received += LENGTH.size + len(body)
+        state = decoder.feed(body)
+        now = time.perf_counter()
+        if state is not None and now - last_report >= 1:
+            x, y = state.player_pos
+            print(f"tick {state.tick:>7} {state.level:<10} player ({x:7.1f}, {y:6.1f})"
+                  f"  health {state.values[0]}  bullets {len(state.bullets) // 8}"
+                  f"  {frames / (now - last_report):.0f} frames/s"
+                  f" {received / frames:.0f} B/frame")
+            frames = received = 0
+            last_report = now
+    writer.close()
+
+async def _bench_subscriber(address, counts, stop, slow):
+    reader, writer = await _open_connection(address)
+    if slow:
+        # Never reads: its buffers fill up and the publisher drops frames
+        await stop.wait()
+    else:
+        decoder = StateDecoder()
+        async for body in read_frames(reader):
+            counts["frames"] += 1
+            counts["bytes"] += LENGTH.size + len(body)
+            if decoder.feed(body) is None:
+                counts["undecodable"] += 1
+    writer.close()
+
+def _bench_subscribers(address, subscribers, slow, connection):
+    """Runs in a process of its own, so the clients do not share the GIL."""
+    counts = dict.fromkeys(("frames", "bytes", "undecodable"), 0)
+
+    async def run():
+        stop = asyncio.Event()
+        clients = [
+            asyncio.create_task(
+                _bench_subscriber(address, counts, stop, i < slow)
+            )
+            for i in range(subscribers)
+        ]
+        loop = asyncio.get_running_loop()
+        # "stop" once the publisher is done; readers end when it hangs up
+        await loop.run_in_executor(None, connection.recv)
+        stop.set()
+        await asyncio.gather(*clients)
+
+    asyncio.run(run())
+    connection.send(counts)
+
+def run_bench(address, subscribers, slow, seconds):
+    # Imported here, bench.py makes the display headless
+    from bench import scripted_input
+
+    publisher = StatePublisher(address).start()
+    parent, child = multiprocessing.Pipe()
+    clients = multiprocessing.Process(
+        target=_bench_subscribers, args=(address, subscribers, slow, child),
+    )
+    clients.start()
+    while len(publisher.subscribers) < subscribers:
+        time.sleep(0.01)
+
+    # The game loop: 60 ticks a second, as when playing
+    level = Code.Level.from_file(Code.LEVEL_FILES[-1])
+    publish_times = []
+    late = frame = 0
+    next_tick = end = time.perf_counter()
+    end += seconds
+    while time.perf_counter() < end:
+        if level.finished:
+            level.hard_reset()
+        level.step(scripted_input(frame))
+        start = time.perf_counter_ns()
+        publisher.publish(level)
+        publish_times.append(time.perf_counter_ns() - start)
+        frame += 1
+        next_tick += 1 / Code.TICK_RATE
+        wait = next_tick - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        elif wait < -1 / Code.TICK_RATE:
+            late += 1
+
+    time.sleep(0.1)  # let the last frames go out
+    dropped = sum(subscriber.dropped for subscriber in publisher.subscribers)
+    parent.send("stop")
+    # Hanging up ends the reading subscribers
+    publisher.close()
+    counts = parent.recv()
+    clients.join()
+
+    publish_times.sort()
+    ticks = len(publish_times)
+    listeners = subscribers - slow
+    print(f"{subscribers} subscribers ({slow} not reading), {ticks} ticks"
+          f" in {seconds:.0f}s")
+    print(f"publish(): p50 {publish_times[ticks // 2] / 1000:.1f}us"
+          f"  p99 {publish_times[ticks * 99 // 100] / 1000:.1f}us"
+          f"  max {publish_times[-1] / 1000:.1f}us, {late} ticks over a frame late")
+    print(f"{publisher.broadcasts} broadcasts, {publisher.coalesced} ticks coalesced")
+    if listeners:
+        print(f"{counts['frames'] / listeners:.0f} frames per reading subscriber,"
+              f" {counts['bytes'] / max(counts['frames'], 1):.1f} B/frame,"
+              f" {counts['frames'] / seconds:,.0f} frames/s in total")
+    print(f"{dropped} frames dropped for subscribers not keeping up")
+    return 1 if counts["undecodable"] else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("serve", "watch", "bench"))
+    parser.add_argument("--address", default=ADDRESS,
+                        help="host:port, or a path for a Unix socket")
+    parser.add_argument("--subscribers", type=int, default=100,
+                        help="bench: connected subscribers")
+    parser.add_argument("--slow", type=int, default=10,
+                        help="bench: how many of them never read")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "watch":
+        asyncio.run(watch(args.address))
+        return 0
+    if args.command == "bench":
+        Code.muted = True
+        return run_bench(args.address, args.subscribers, args.slow, args.seconds)
+    publisher = StatePublisher(args.address).start()
+    try:
+        Code.Game(Code.LEVEL_FILES, publisher=publisher).main()
+    finally:
+        publisher.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())